@@ -0,0 +1,188 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class AIClientError(Exception):
+    """Raised when OpenRouter cannot answer, after any retries"""
+    pass
+
+class AIClient:
+    """Shared OpenRouter client: one keep-alive connection pool for the process.
+
+    Every call gets connect/read timeouts, and connection failures or 429/5xx
+    answers are retried with jittered exponential backoff. A semaphore caps
+    concurrent upstream calls so a slow upstream cannot tie up every web
+    worker thread. Latency is recorded per purpose for metrics().
+    """
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.AI_MAX_CONCURRENCY)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {Config.OPENROUTER_API_KEY}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://taskboard.example.com",  # Optional, for OpenRouter tracking
+            "X-Title": "TaskBoard"  # Optional, for OpenRouter tracking
+        })
+        self.slots = threading.BoundedSemaphore(Config.AI_MAX_CONCURRENCY)
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), Config.AI_BACKOFF_MAX)
+        # Full jitter keeps retrying workers from hitting the upstream in lockstep
+        return random.uniform(0, min(Config.AI_BACKOFF_MAX, Config.AI_BACKOFF_BASE * 2 ** attempt))
+
+    def send(self, payload, stream=False):
+        """POST a chat completion payload with retries; returns the requests.Response"""
+        for attempt in range(Config.AI_MAX_RETRIES + 1):
+            last_attempt = attempt == Config.AI_MAX_RETRIES
+            try:
+                response = self.session.post(
+                    Config.OPENROUTER_API_URL,
+                    json=payload,
+                    timeout=(Config.AI_CONNECT_TIMEOUT, Config.AI_READ_TIMEOUT),
+                    stream=stream
+                )
+            except requests.ConnectionError as e:
+                # Includes connect timeouts; a read timeout is not retried
+                # because the upstream may still be working on (and billing) it
+                if last_attempt:
+                    raise AIClientError(f'Could not reach OpenRouter: {e}')
+                time.sleep(self.backoff(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+                time.sleep(self.backoff(attempt, retry_after))
+                continue
+            try:
+                response.raise_for_status()
+            except requests.HTTPError as e:
+                response.close()
+                raise AIClientError(str(e))
+            return response
+
+    def acquire(self, purpose):
+        if not self.slots.acquire(timeout=Config.AI_QUEUE_TIMEOUT):
+            self.record(purpose, 0, 'busy')
+            raise AIClientError('Too many AI requests in progress, please try again')
+
+    def payload(self, messages, stream=False):
+        payload = {
+            "model": Config.OPENROUTER_MODEL,
+            "messages": messages
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def complete(self, messages, purpose='chat'):
+        """Return the stripped assistant reply for a list of chat messages"""
+        self.acquire(purpose)
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            data = self.send(self.payload(messages)).json()
+            result = data["choices"][0]["message"]["content"].strip()
+            outcome = 'ok'
+            return result
+        except requests.Timeout:
+            outcome = 'timeout'
+            raise AIClientError('OpenRouter did not respond in time')
+        finally:
+            self.slots.release()
+            self.record(purpose, (time.perf_counter() - start) * 1000, outcome)
+
+    def stream(self, messages, purpose='chat'):
+        """Yield the assistant reply in pieces as OpenRouter's SSE stream delivers them.
+
+        The concurrency slot is held until the stream ends or the caller
+        closes the generator (e.g. the browser disconnects).
+        """
+        self.acquire(purpose)
+        start = time.perf_counter()
+        first_token = None
+        outcome = 'error'
+        response = None
+        try:
+            response = self.send(self.payload(messages, stream=True), stream=True)
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                # Blank lines separate events; ':' lines are keep-alive comments
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if 'error' in chunk:
+                    raise AIClientError(chunk['error'].get('message', 'OpenRouter stream failed'))
+                choices = chunk.get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    if first_token is None:
+                        first_token = (time.perf_counter() - start) * 1000
+                    yield content
+            outcome = 'ok'
+        except GeneratorExit:
+            outcome = 'cancelled'  # Browser went away mid-stream
+            raise
+        except requests.Timeout:
+            outcome = 'timeout'
+            raise AIClientError('OpenRouter did not respond in time')
+        except requests.RequestException as e:
+            raise AIClientError(f'OpenRouter stream failed: {e}')
+        finally:
+            if response is not None:
+                response.close()
+            self.slots.release()
+            self.record(purpose, (time.perf_counter() - start) * 1000, outcome, first_token)
+
+    def record(self, purpose, latency_ms, outcome, first_token_ms=None):
+        with self.lock:
+            stats = self.stats.setdefault(purpose, {
+                'calls': 0, 'outcomes': {},
+                'latencies': deque(maxlen=Config.AI_METRICS_WINDOW),
+                'first_tokens': deque(maxlen=Config.AI_METRICS_WINDOW)
+            })
+            stats['calls'] += 1
+            stats['outcomes'][outcome] = stats['outcomes'].get(outcome, 0) + 1
+            if outcome != 'busy':
+                stats['latencies'].append(latency_ms)
+            if first_token_ms is not None:
+                stats['first_tokens'].append(first_token_ms)
+
+    def metrics(self):
+        """Per-purpose call counts and latency percentiles for this process"""
+        with self.lock:
+            snapshot = {purpose: (stats['calls'], dict(stats['outcomes']),
+                                  sorted(stats['latencies']), sorted(stats['first_tokens']))
+                        for purpose, stats in self.stats.items()}
+        result = {}
+        for purpose, (calls, outcomes, latencies, first_tokens) in snapshot.items():
+            entry = {'calls': calls, 'outcomes': outcomes}
+            entry.update(percentiles(latencies, 'ms'))
+            entry.update(percentiles(first_tokens, 'first_token_ms'))
+            result[purpose] = entry
+        return result
+
+def percentiles(values, suffix):
+    if not values:
+        return {}
+    return {
+        f'p50_{suffix}': round(values[len(values) // 2], 1),
+        f'p95_{suffix}': round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+        f'max_{suffix}': round(values[-1], 1),
+    }
+
+ai_client = AIClient()
@@ -1,17 +1,24 @@
+import click
 from flask import Flask, render_template, session, redirect, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
 from routes import *
 from config import Config
-from models import Teacher
+from models import ProgressStats, ValidationCache, NotificationArchive, NotificationReadState
+from indexes import ensure_indexes, index_report, explain_hot_queries
 
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = Config.SECRET_KEY
+if Config.PROXY_FIX_X_FOR:
+    # Login rate limits key on request.remote_addr, which must be the client, not the proxy
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.PROXY_FIX_X_FOR)
 
 # Register routes
 app.add_url_rule('/', 'login', login, methods=['GET', 'POST'])
 app.add_url_rule('/logout', 'logout', logout)
 app.add_url_rule('/admin/dashboard', 'admin_dashboard', admin_dashboard)
 app.add_url_rule('/admin/students', 'manage_students', manage_students)
+app.add_url_rule('/admin/students/page', 'manage_students_page', manage_students_page)
 app.add_url_rule('/admin/students/add', 'add_student', add_student, methods=['GET', 'POST'])
 app.add_url_rule('/admin/students/edit/<student_id>', 'edit_student', edit_student, methods=['GET', 'POST'])
 app.add_url_rule('/admin/students/delete/<student_id>', 'delete_student', delete_student, methods=['POST'])
@@ -31,6 +38,7 @@ app.add_url_rule('/admin/task/<task_id>', 'task_details', task_details)
 app.add_url_rule('/admin/submission/<task_id>/<student_id>', 'view_submission', view_submission)
 app.add_url_rule('/teacher/dashboard', 'teacher_dashboard', teacher_dashboard)
 app.add_url_rule('/teacher/students', 'teacher_students', teacher_students)
+app.add_url_rule('/teacher/students/page', 'teacher_students_page', teacher_students_page)
 app.add_url_rule('/teacher/students/add', 'teacher_add_student', teacher_add_student, methods=['GET', 'POST'])
 app.add_url_rule('/teacher/students/edit/<student_id>', 'teacher_edit_student', teacher_edit_student, methods=['GET', 'POST'])
 app.add_url_rule('/teacher/students/delete/<student_id>', 'teacher_delete_student', teacher_delete_student, methods=['POST'])
@@ -47,16 +55,20 @@ app.add_url_rule('/student/practice', 'practice_editor', practice_editor)
 app.add_url_rule('/install_libraries', 'install_arduino_libraries', install_arduino_libraries, methods=['POST'])
 app.add_url_rule('/install_python_libs', 'install_python_libs', install_python_libs, methods=['POST'])
 app.add_url_rule('/compile', 'compile_code', compile_code, methods=['POST'])
+app.add_url_rule('/compile/<job_id>', 'compile_status', compile_status, methods=['GET'])
 app.add_url_rule('/python_run', 'run_python', run_python, methods=['POST'])
+app.add_url_rule('/python_run/<job_id>', 'python_run_status', python_run_status, methods=['GET'])
 app.add_url_rule('/submit_task', 'submit_task', submit_task, methods=['POST'])
 app.add_url_rule('/validate_code', 'validate_code', validate_code, methods=['POST'])
 
 # New OpenRouter AI Integration Routes
 app.add_url_rule('/generate_code', 'generate_code', generate_code, methods=['POST'])
 app.add_url_rule('/ai_chat', 'ai_chat', ai_chat, methods=['POST'])
+app.add_url_rule('/admin/ai_metrics', 'ai_metrics', ai_metrics)
 
 # Notification Routes
 app.add_url_rule('/notifications', 'get_notifications', get_notifications, methods=['GET'])
+app.add_url_rule('/notifications/stream', 'notification_stream', notification_stream)
 app.add_url_rule('/notifications/<notification_id>/read', 'mark_notification_read', mark_notification_read, methods=['POST'])
 app.add_url_rule('/notifications/read-all', 'mark_all_notifications_read', mark_all_notifications_read, methods=['POST'])
 
@@ -77,12 +89,10 @@ def inject_user():
     teacher_can_manage_tasks = False
     
     if user_type == 'teacher':
-        teacher_id = session.get('teacher_id')
-        if teacher_id:
-            teacher = Teacher.find_by_id(teacher_id)
-            if teacher:
-                teacher_can_manage_students = teacher.get('can_manage_students', False)
-                teacher_can_manage_tasks = teacher.get('can_manage_tasks', False)
+        teacher = current_user()
+        if teacher:
+            teacher_can_manage_students = teacher.get('can_manage_students', False)
+            teacher_can_manage_tasks = teacher.get('can_manage_tasks', False)
     
     return {
         'user_type': user_type,
@@ -130,12 +140,89 @@ def before_request():
     # Add any pre-request logic here if needed
     pass
 
+@app.cli.command('rebuild-progress')
+def rebuild_progress():
+    """
+    Recompute the materialized progress counters from scratch; run once after
+    upgrading, before serving traffic (writes made during the rebuild are lost)
+    """
+    count = ProgressStats.rebuild()
+    print(f"✅ Rebuilt {count} progress counters")
+
+@app.cli.command('migrate-read-state')
+def migrate_read_state():
+    """
+    Seed per-user notification read state from the legacy isRead flags;
+    run once after upgrading, before archive-notifications drops the flags
+    """
+    seeded = NotificationReadState.migrate_legacy()
+    print(f"✅ Seeded read state for {seeded} users")
+
+@app.cli.command('validation-cache-stats')
+def validation_cache_stats():
+    """
+    Show AI validation cache entries and hits (API calls saved) per model
+    """
+    for stats in ValidationCache.get_stats():
+        print(f"🤖 {stats['_id']}: {stats['entries']} cached verdicts, {stats['hits']} hits")
+
+@app.cli.command('archive-notifications')
+@click.option('--older-than-days', type=float, default=None,
+              help='Archive notifications older than this (default: NOTIFICATION_ARCHIVE_AFTER)')
+def archive_notifications(older_than_days):
+    """
+    Move old notifications into notifications_archive; run daily from a scheduler
+    """
+    if Config.NOTIFICATION_TTL <= Config.NOTIFICATION_ARCHIVE_AFTER:
+        print("⚠️ NOTIFICATION_TTL is not longer than NOTIFICATION_ARCHIVE_AFTER; notifications expire before they are archived")
+    older_than = older_than_days * 24 * 3600 if older_than_days is not None else None
+    moved = NotificationArchive.archive(older_than)
+    print(f"✅ Archived {moved} notifications")
+
+@app.cli.group('indexes')
+def indexes_cli():
+    """
+    Manage MongoDB indexes
+    """
+
+@indexes_cli.command('ensure')
+def ensure_indexes_command():
+    """
+    Create any missing indexes
+    """
+    if ensure_indexes():
+        raise SystemExit(1)
+
+@indexes_cli.command('report')
+def index_report_command():
+    """
+    Report missing/unused indexes and check hot queries use IXSCAN
+    """
+    problems = False
+    for entry in index_report():
+        print(f"📁 {entry['collection']}")
+        print(f"   missing:    {', '.join(entry['missing']) or '-'}")
+        print(f"   undeclared: {', '.join(entry['undeclared']) or '-'}")
+        print(f"   unused:     {', '.join(entry['unused']) or '-'}")
+        problems = problems or bool(entry['missing'])
+    
+    print("🔍 Hot query plans:")
+    for result in explain_hot_queries():
+        marker = '✅' if result['uses_index'] else '❌'
+        print(f"   {marker} {result['collection']} {result['query']} -> {' > '.join(result['stages'])}")
+        problems = problems or not result['uses_index']
+    
+    if problems:
+        raise SystemExit(1)
+
 def init_app():
     """
     Initialize the application with default data
     """
     try:
         initialize_default_data()
+        ensure_indexes()
+        NotificationReadState.ensure_migrated()
         print("✅ Application initialized successfully!")
         print("📊 Default data loaded:")
         print("   - Admin account created (admin/admin123)")
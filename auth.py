@@ -0,0 +1,42 @@
+from config import Config
+from models import Admin, Teacher, Student, LoginAttempt, bcrypt_pool
+from workers import QueueFull
+
+USER_MODELS = {'admin': Admin, 'teacher': Teacher, 'student': Student}
+
+class LoginThrottled(Exception):
+    """Raised before any hashing when the account or client IP has too many recent failures"""
+    def __init__(self, retry_after):
+        super().__init__(f'Too many failed logins, try again in {retry_after} seconds')
+        self.retry_after = retry_after
+
+class LoginBusy(Exception):
+    """Raised when the hashing pool cannot take the login in time"""
+    pass
+
+def authenticate(user_type, username, password, ip):
+    """Return the user document for valid credentials, else None.
+
+    bcrypt runs on the shared bcrypt_pool, never in the request thread: bcrypt
+    releases the GIL, so LOGIN_WORKERS checks use that many cores while the rest of
+    a 9:00 login wave queues (up to LOGIN_QUEUE_LIMIT) instead of starving
+    every other request of CPU.
+    """
+    retry_after = LoginAttempt.retry_after(user_type, username, ip)
+    if retry_after:
+        raise LoginThrottled(retry_after)
+
+    try:
+        job = bcrypt_pool.submit(USER_MODELS[user_type].verify_password, username, password)
+    except QueueFull:
+        raise LoginBusy('Too many logins in progress, please try again')
+    if not job.done.wait(Config.LOGIN_TIMEOUT):
+        raise LoginBusy('Login timed out, please try again')
+    if job.error is not None:
+        raise job.error
+
+    if job.result:
+        LoginAttempt.clear(user_type, username)
+    else:
+        LoginAttempt.record_failure(user_type, username, ip)
+    return job.result
@@ -0,0 +1,48 @@
+"""Measure bcrypt logins/second at each work factor, on one thread and on a pool.
+
+    python bench_login.py [seconds per measurement] [rounds ...]
+
+bcrypt releases the GIL, so a pool of LOGIN_WORKERS threads should scale
+close to linearly up to the core count. Pick BCRYPT_ROUNDS so that
+"per core" times cores covers the expected 9:00 login wave.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+PASSWORD = b'123456'
+
+def measure(password_hash, seconds, threads):
+    """Return checks/second with `threads` threads checking in parallel for `seconds`"""
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        checks = 0
+        while time.perf_counter() < deadline:
+            bcrypt.checkpw(PASSWORD, password_hash)
+            checks += 1
+        return checks
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        checks = sum(pool.map(lambda _: worker(), range(threads)))
+    return checks / (time.perf_counter() - start)
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    rounds = [int(r) for r in sys.argv[2:]] or [10, 11, 12]
+    cores = os.cpu_count() or 1
+
+    print(f"{cores} cores, {seconds:g}s per measurement")
+    print(f"{'rounds':<8}{'ms/check':>10}{'1 thread/s':>12}{f'{cores} threads/s':>14}{'per core/s':>12}")
+    for cost in rounds:
+        password_hash = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(cost))
+        single = measure(password_hash, seconds, 1)
+        pooled = measure(password_hash, seconds, cores)
+        print(f"{cost:<8}{1000 / single:>10.1f}{single:>12.1f}{pooled:>14.1f}{pooled / cores:>12.1f}")
+
+if __name__ == '__main__':
+    main()
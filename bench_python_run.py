@@ -0,0 +1,51 @@
+"""Compare /python_run latency: fresh interpreter per run vs. the warm pool.
+
+    python bench_python_run.py [runs]
+"""
+import statistics
+import sys
+import time
+
+from sandbox import WarmInterpreterPool, run_python_subprocess
+
+SCRIPTS = [
+    'print("Hello, world!")',
+    'total = sum(i * i for i in range(1000))\nprint(total)',
+    'import math, random\nprint(round(math.sqrt(random.randint(1, 100)), 2))',
+    'names = ["a", "b", "c"]\nfor i, name in enumerate(names):\n    print(i, name)',
+]
+
+def measure(run, runs):
+    timings = []
+    for i in range(runs):
+        code = SCRIPTS[i % len(SCRIPTS)]
+        start = time.perf_counter()
+        result = run(code)
+        timings.append((time.perf_counter() - start) * 1000)
+        if result['status'] != 'success':
+            raise RuntimeError(f"Benchmark script failed: {result['output']}")
+    timings.sort()
+    return {
+        'median': statistics.median(timings),
+        'p95': timings[int(len(timings) * 0.95) - 1],
+        'max': timings[-1],
+    }
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    pool = WarmInterpreterPool(1)
+    pool.replenish()
+
+    results = {
+        'subprocess (current)': measure(run_python_subprocess, runs),
+        'warm pool': measure(pool.run, runs),
+    }
+
+    print(f"{runs} runs per mode")
+    print(f"{'mode':<22}{'median ms':>12}{'p95 ms':>12}{'max ms':>12}")
+    for mode, stats in results.items():
+        print(f"{mode:<22}{stats['median']:>12.1f}{stats['p95']:>12.1f}{stats['max']:>12.1f}")
+
+if __name__ == '__main__':
+    main()
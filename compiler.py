@@ -0,0 +1,237 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from config import Config
+from workers import JobPool
+
+SKETCH_NAME = 'sketch'
+ARTIFACT_SUFFIXES = ('.hex', '.elf', '.bin', '.eep')
+
+fingerprint_lock = threading.Lock()
+fingerprint_cache = {'value': None, 'expires': 0, 'generation': 0, 'refreshing': False}
+
+def cache_path(*parts):
+    return os.path.join(Config.COMPILE_CACHE_DIR, *parts)
+
+def normalize_sketch(code):
+    """Normalize line endings and trailing whitespace without moving any line numbers"""
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).rstrip('\n') + '\n'
+
+def arduino_cli(*args, timeout=None):
+    return subprocess.run([Config.ARDUINO_CLI_PATH, *args], capture_output=True, text=True, timeout=timeout)
+
+def toolchain_fingerprint():
+    """Hash of the installed cores and libraries; cached briefly to avoid shelling out per compile.
+
+    Runs arduino-cli twice when the cache is cold, so only job and background
+    threads call it; request threads use cached_fingerprint().
+    """
+    with fingerprint_lock:
+        if fingerprint_cache['value'] and fingerprint_cache['expires'] > time.time():
+            return fingerprint_cache['value']
+        generation = fingerprint_cache['generation']
+    libraries = arduino_cli('lib', 'list', '--format', 'json', timeout=30).stdout
+    cores = arduino_cli('core', 'list', '--format', 'json', timeout=30).stdout
+    value = hashlib.sha256((libraries + cores).encode('utf-8')).hexdigest()
+    with fingerprint_lock:
+        # A listing taken before an invalidation may predate the change
+        if fingerprint_cache['generation'] == generation:
+            fingerprint_cache['value'] = value
+            fingerprint_cache['expires'] = time.time() + Config.COMPILE_FINGERPRINT_TTL
+    return value
+
+def refresh_fingerprint():
+    try:
+        toolchain_fingerprint()
+    except Exception as e:
+        print(f"❌ Error refreshing toolchain fingerprint: {e}")
+    finally:
+        with fingerprint_lock:
+            fingerprint_cache['refreshing'] = False
+
+def cached_fingerprint():
+    """The fingerprint without shelling out: the cached value, or None if there is none.
+
+    An expired value is still returned while a background thread refreshes it.
+    """
+    with fingerprint_lock:
+        value = fingerprint_cache['value']
+        start = fingerprint_cache['expires'] <= time.time() and not fingerprint_cache['refreshing']
+        if start:
+            fingerprint_cache['refreshing'] = True
+    if start:
+        threading.Thread(target=refresh_fingerprint, name='toolchain-fingerprint', daemon=True).start()
+    return value
+
+def invalidate_toolchain_fingerprint():
+    with fingerprint_lock:
+        fingerprint_cache['value'] = None
+        fingerprint_cache['expires'] = 0
+        fingerprint_cache['generation'] += 1
+    cached_fingerprint()
+
+def cache_key(sketch, fqbn, fingerprint):
+    payload = json.dumps([fqbn, fingerprint, sketch])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def cache_get(key):
+    if not re.fullmatch(r'[0-9a-f]{64}', key):
+        return None
+    result_path = cache_path('entries', key, 'result.json')
+    try:
+        with open(result_path) as f:
+            result = json.load(f)
+        os.utime(result_path)  # mtime doubles as the LRU timestamp
+        return result
+    except (OSError, ValueError):
+        return None
+
+def cache_put(key, result, output_dir):
+    entries = cache_path('entries')
+    os.makedirs(entries, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'{key}.', dir=entries)
+    for name in os.listdir(output_dir) if os.path.isdir(output_dir) else []:
+        if name.endswith(ARTIFACT_SUFFIXES):
+            shutil.copy(os.path.join(output_dir, name), staging)
+    result = dict(result, artifacts=sorted(os.listdir(staging)))
+    with open(os.path.join(staging, 'result.json'), 'w') as f:
+        json.dump(result, f)
+    try:
+        os.rename(staging, os.path.join(entries, key))
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)  # Another worker stored it first
+    evict()
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def evict():
+    """Drop least recently used entries until the cache fits COMPILE_CACHE_MAX_MB"""
+    entries = cache_path('entries')
+    limit = Config.COMPILE_CACHE_MAX_MB * 1024 * 1024
+    candidates = []
+    for key in os.listdir(entries):
+        result_path = os.path.join(entries, key, 'result.json')
+        if os.path.exists(result_path):
+            candidates.append((os.path.getmtime(result_path), directory_size(os.path.join(entries, key)), key))
+    total = sum(size for _, size, _ in candidates)
+    for _, size, key in sorted(candidates):
+        if total <= limit:
+            break
+        shutil.rmtree(os.path.join(entries, key), ignore_errors=True)
+        total -= size
+
+class BuildSlot:
+    """Host-wide compile slot backed by a flock, with a persistent --build-path.
+
+    Holding a slot caps concurrent arduino-cli runs across every gunicorn
+    worker on the host and lets each slot reuse its previous build outputs.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock_file = None
+        self.path = None
+
+    def __enter__(self):
+        os.makedirs(cache_path('build'), exist_ok=True)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            for slot in range(Config.COMPILE_WORKERS):
+                lock_file = open(cache_path('build', f'slot-{slot}.lock'), 'w')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    continue
+                self.lock_file = lock_file
+                self.path = cache_path('build', f'slot-{slot}')
+                os.makedirs(self.path, exist_ok=True)
+                return self
+            if time.monotonic() > deadline:
+                raise TimeoutError('All compile slots are busy')
+            time.sleep(0.1)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+def run_compile(sketch, fqbn, build_path):
+    temp_dir = tempfile.mkdtemp(prefix='sketch-')
+    try:
+        sketch_dir = os.path.join(temp_dir, SKETCH_NAME)
+        output_dir = os.path.join(temp_dir, 'output')
+        os.makedirs(sketch_dir)
+        with open(os.path.join(sketch_dir, f'{SKETCH_NAME}.ino'), 'w') as f:
+            f.write(sketch)
+
+        result = arduino_cli(
+            'compile', '--fqbn', fqbn,
+            '--build-path', build_path,
+            '--build-cache-path', cache_path('core'),
+            '--output-dir', output_dir,
+            sketch_dir,
+            timeout=Config.COMPILE_TIMEOUT
+        )
+        if result.returncode == 0:
+            compiled = {"status": "success", "output": result.stdout}
+        else:
+            compiled = {"status": "error", "output": result.stderr}
+        return compiled, output_dir, temp_dir
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+def prepare_sketch(code, fqbn=None):
+    """Return (sketch, fqbn, cache key) for a raw sketch without shelling out.
+
+    The key is None until the toolchain fingerprint is known; compile_prepared
+    then computes it in the job thread.
+    """
+    fqbn = fqbn or Config.DEFAULT_FQBN
+    sketch = normalize_sketch(code)
+    fingerprint = cached_fingerprint()
+    return sketch, fqbn, cache_key(sketch, fqbn, fingerprint) if fingerprint else None
+
+def cached_result(key):
+    cached = cache_get(key)
+    if cached:
+        return {"status": cached['status'], "output": cached['output'], "cached": True}
+    return None
+
+def compile_prepared(sketch, fqbn, key=None):
+    key = key or cache_key(sketch, fqbn, toolchain_fingerprint())
+    cached = cached_result(key)
+    if cached:
+        return cached
+
+    with BuildSlot(Config.COMPILE_TIMEOUT) as slot:
+        compiled, output_dir, temp_dir = run_compile(sketch, fqbn, slot.path)
+    try:
+        cache_put(key, compiled, output_dir)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return dict(compiled, cached=False)
+
+def compile_sketch(code, fqbn=None):
+    """Compile a sketch, answering repeat sketches from the content-addressed cache"""
+    return compile_prepared(*prepare_sketch(code, fqbn))
+
+# Compile jobs are keyed by cache key when the request knows it, so identical
+# in-flight sketches share one build. BuildSlot caps arduino-cli runs per host;
+# this pool caps them per process.
+compile_runner = JobPool('compile', Config.COMPILE_WORKERS, Config.COMPILE_QUEUE_LIMIT)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 class Config:
@@ -13,8 +14,85 @@ class Config:
     # Arduino CLI configuration
     ARDUINO_CLI_PATH = 'arduino-cli'
     DEFAULT_FQBN = 'arduino:avr:uno'
+    COMPILE_CACHE_DIR = os.environ.get('COMPILE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'taskboard-compile-cache')
+    COMPILE_CACHE_MAX_MB = int(os.environ.get('COMPILE_CACHE_MAX_MB') or 512)
+    COMPILE_WORKERS = int(os.environ.get('COMPILE_WORKERS') or 2)
+    COMPILE_QUEUE_LIMIT = int(os.environ.get('COMPILE_QUEUE_LIMIT') or 40)
+    COMPILE_TIMEOUT = int(os.environ.get('COMPILE_TIMEOUT') or 120)
+    COMPILE_FINGERPRINT_TTL = int(os.environ.get('COMPILE_FINGERPRINT_TTL') or 300)
+    
+    # Python sandbox configuration for /python_run
+    PYTHON_RUN_WORKERS = int(os.environ.get('PYTHON_RUN_WORKERS') or os.cpu_count() or 2)
+    PYTHON_RUN_QUEUE_LIMIT = int(os.environ.get('PYTHON_RUN_QUEUE_LIMIT') or 40)
+    PYTHON_RUN_TIMEOUT = int(os.environ.get('PYTHON_RUN_TIMEOUT') or 10)
+    PYTHON_RUN_CPU_SECONDS = int(os.environ.get('PYTHON_RUN_CPU_SECONDS') or 5)
+    PYTHON_RUN_MEMORY_MB = int(os.environ.get('PYTHON_RUN_MEMORY_MB') or 512)
+    PYTHON_RUN_OUTPUT_LIMIT = int(os.environ.get('PYTHON_RUN_OUTPUT_LIMIT') or 64 * 1024)
+    PYTHON_RUN_WARM_POOL = os.environ.get('PYTHON_RUN_WARM_POOL', '1') != '0'
+    PYTHON_RUN_WARM_MAX_RUNS = int(os.environ.get('PYTHON_RUN_WARM_MAX_RUNS') or 50)
     
     # OpenRouter AI configuration for code validation
     OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY') or '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'
     OPENROUTER_MODEL = os.environ.get('OPENROUTER_MODEL') or 'openai/gpt-4o'
-    OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
\ No newline at end of file
+    OPENROUTER_API_URL = os.environ.get('OPENROUTER_API_URL') or "https://openrouter.ai/api/v1/chat/completions"
+    AI_CONNECT_TIMEOUT = float(os.environ.get('AI_CONNECT_TIMEOUT') or 5)
+    AI_READ_TIMEOUT = float(os.environ.get('AI_READ_TIMEOUT') or 60)
+    AI_MAX_RETRIES = int(os.environ.get('AI_MAX_RETRIES') or 2)
+    AI_BACKOFF_BASE = float(os.environ.get('AI_BACKOFF_BASE') or 0.5)
+    AI_BACKOFF_MAX = float(os.environ.get('AI_BACKOFF_MAX') or 8)
+    AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY') or 8)
+    AI_QUEUE_TIMEOUT = float(os.environ.get('AI_QUEUE_TIMEOUT') or 10)
+    AI_METRICS_WINDOW = int(os.environ.get('AI_METRICS_WINDOW') or 500)
+    
+    # gunicorn processes, and threads per process for ordinary requests (gunicorn.conf.py)
+    WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY') or 4)
+    WEB_THREADS = int(os.environ.get('WEB_THREADS') or 64)
+    
+    # Server-sent notification push (/notifications/stream)
+    # Each open stream holds a thread for up to NOTIFICATION_STREAM_MAX_AGE, so
+    # gunicorn.conf.py gives every process NOTIFICATION_STREAM_MAX_CLIENTS
+    # threads on top of WEB_THREADS. The cap is sized so the expected number of
+    # concurrently open pages (NOTIFICATION_STREAM_AUDIENCE) can all stream;
+    # pages beyond it deliberately fall back to polling.
+    NOTIFICATION_CHANGE_STREAM = os.environ.get('NOTIFICATION_CHANGE_STREAM', '1') != '0'
+    NOTIFICATION_STREAM_AUDIENCE = int(os.environ.get('NOTIFICATION_STREAM_AUDIENCE') or 1600)
+    NOTIFICATION_STREAM_MAX_CLIENTS = int(os.environ.get('NOTIFICATION_STREAM_MAX_CLIENTS') or
+                                          -(-NOTIFICATION_STREAM_AUDIENCE // WEB_WORKERS))
+    NOTIFICATION_STREAM_HEARTBEAT = int(os.environ.get('NOTIFICATION_STREAM_HEARTBEAT') or 25)
+    NOTIFICATION_STREAM_MAX_AGE = int(os.environ.get('NOTIFICATION_STREAM_MAX_AGE') or 600)
+    NOTIFICATION_UNREAD_CACHE_TTL = int(os.environ.get('NOTIFICATION_UNREAD_CACHE_TTL') or 30)
+    NOTIFICATION_UNREAD_CACHE_SIZE = int(os.environ.get('NOTIFICATION_UNREAD_CACHE_SIZE') or 5000)
+    NOTIFICATION_READ_IDS_MAX = int(os.environ.get('NOTIFICATION_READ_IDS_MAX') or 500)
+    NOTIFICATION_BACKGROUND_WRITES = os.environ.get('NOTIFICATION_BACKGROUND_WRITES', '1') != '0'
+    NOTIFICATION_WRITE_QUEUE_LIMIT = int(os.environ.get('NOTIFICATION_WRITE_QUEUE_LIMIT') or 200)
+    
+    # Notification retention: archive after NOTIFICATION_ARCHIVE_AFTER, expire at NOTIFICATION_TTL
+    NOTIFICATION_ARCHIVE_AFTER = int(os.environ.get('NOTIFICATION_ARCHIVE_AFTER') or 30 * 24 * 3600)
+    NOTIFICATION_TTL = int(os.environ.get('NOTIFICATION_TTL') or 90 * 24 * 3600)
+    NOTIFICATION_ARCHIVE_TTL = int(os.environ.get('NOTIFICATION_ARCHIVE_TTL') or 365 * 24 * 3600)
+    NOTIFICATION_ARCHIVE_BATCH = int(os.environ.get('NOTIFICATION_ARCHIVE_BATCH') or 1000)
+    
+    # Request identity cache for signed-in teachers and students
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 5000)
+    
+    # Keyset-paginated student lists (manage_students, teacher_students)
+    STUDENT_PAGE_SIZE = int(os.environ.get('STUDENT_PAGE_SIZE') or 50)
+    STUDENT_PAGE_MAX_SIZE = int(os.environ.get('STUDENT_PAGE_MAX_SIZE') or 200)
+    
+    # Login: bcrypt work factor, hashing pool and failed-attempt limits
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS') or 12)
+    LOGIN_WORKERS = int(os.environ.get('LOGIN_WORKERS') or os.cpu_count() or 2)
+    LOGIN_QUEUE_LIMIT = int(os.environ.get('LOGIN_QUEUE_LIMIT') or 64)
+    LOGIN_TIMEOUT = float(os.environ.get('LOGIN_TIMEOUT') or 10)
+    LOGIN_ACCOUNT_MAX_FAILURES = int(os.environ.get('LOGIN_ACCOUNT_MAX_FAILURES') or 10)
+    LOGIN_ACCOUNT_WINDOW = int(os.environ.get('LOGIN_ACCOUNT_WINDOW') or 900)
+    # A whole school can share one address, so the per-IP limit is generous
+    LOGIN_IP_MAX_FAILURES = int(os.environ.get('LOGIN_IP_MAX_FAILURES') or 200)
+    LOGIN_IP_WINDOW = int(os.environ.get('LOGIN_IP_WINDOW') or 300)
+    # Number of reverse proxies in front of the app whose X-Forwarded-For is trusted
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)
+    
+    # Cache for AI validation verdicts
+    VALIDATION_CACHE_TTL = int(os.environ.get('VALIDATION_CACHE_TTL') or 7 * 24 * 3600)
+    VALIDATION_CACHE_LOCAL_SIZE = int(os.environ.get('VALIDATION_CACHE_LOCAL_SIZE') or 1000)
\ No newline at end of file
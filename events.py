@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+from pymongo.errors import OperationFailure, PyMongoError
+from database import db
+from config import Config
+
+# Raised by $changeStream on a standalone mongod (no replica set / oplog)
+CHANGE_STREAMS_UNSUPPORTED = (40573, 40324)
+
+class TooManySubscribers(Exception):
+    """Raised when this process already holds its share of open streams"""
+    pass
+
+class Subscriber:
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self.queue = queue.Queue(maxsize=100)
+        self.overflowed = False
+
+class NotificationBroker:
+    """In-process pub/sub for new notifications, fed by a MongoDB change stream.
+
+    Every web worker process watches the notifications collection once and
+    fans new documents out to its own SSE subscribers, so a notification
+    created by any process reaches every open page. On a deployment without
+    change streams (standalone mongod), Notification.write_many publishes
+    directly instead, which only reaches pages served by the same process.
+    """
+    def __init__(self):
+        self.collection = db.get_collection('notifications')
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.watcher = None
+        self.watching = False
+
+    def subscribe(self, predicate):
+        """Register a subscriber that receives documents for which predicate(doc) is true"""
+        with self.lock:
+            if len(self.subscribers) >= Config.NOTIFICATION_STREAM_MAX_CLIENTS:
+                raise TooManySubscribers()
+            subscriber = Subscriber(predicate)
+            self.subscribers.append(subscriber)
+            if self.watcher is None and Config.NOTIFICATION_CHANGE_STREAM:
+                self.watcher = threading.Thread(target=self.watch, name='notification-watch', daemon=True)
+                self.watcher.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, doc):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                if not subscriber.predicate(doc):
+                    continue
+                subscriber.queue.put_nowait(doc)
+            except queue.Full:
+                # The page fell behind; it reloads the list instead
+                subscriber.overflowed = True
+            except Exception as e:
+                print(f"❌ Notification subscriber error: {e}")
+
+    def publish_local(self, doc):
+        """Called by Notification.write_many; a no-op while the change stream delivers"""
+        if not self.watching:
+            self.publish(doc)
+
+    def watch(self):
+        resume_token = None
+        delay = 1
+        while True:
+            try:
+                pipeline = [{'$match': {'operationType': 'insert'}}]
+                with self.collection.watch(pipeline, resume_after=resume_token) as stream:
+                    self.watching = True
+                    delay = 1
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        self.publish(change['fullDocument'])
+            except OperationFailure as e:
+                self.watching = False
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    print("ℹ️ Change streams unavailable; notifications are pushed within this process only")
+                    return
+                print(f"❌ Notification change stream error: {e}")
+                resume_token = None  # The token may have fallen off the oplog
+            except PyMongoError as e:
+                self.watching = False
+                print(f"❌ Notification change stream error: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+notification_broker = NotificationBroker()
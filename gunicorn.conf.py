@@ -0,0 +1,8 @@
+"""gunicorn settings; gunicorn loads this file from the working directory."""
+from config import Config
+
+worker_class = 'gthread'
+workers = Config.WEB_WORKERS
+# Open notification streams each hold a thread, so they get their own on top
+# of the threads for ordinary requests and can never starve them
+threads = Config.WEB_THREADS + Config.NOTIFICATION_STREAM_MAX_CLIENTS
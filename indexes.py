@@ -0,0 +1,104 @@
+from datetime import datetime
+from pymongo.errors import OperationFailure
+from models import Student, Task, Submission, ProgressStats, ValidationCache, Admin, Teacher, Notification, NotificationReadState, NotificationArchive, LoginAttempt, JobRecord
+
+INDEX_OPTIONS_CONFLICT = 85
+
+# Models whose collections declare indexes
+INDEXED_MODELS = [Student, Task, Submission, ProgressStats, ValidationCache, Admin, Teacher, Notification, NotificationReadState, NotificationArchive, LoginAttempt, JobRecord]
+
+# Hot queries that must be served by an index: (model, filter, sort)
+HOT_QUERIES = [
+    (Student, {'studentID': 'SUB-001'}, None),
+    (Student, {'campus': 'Yamuna', 'grade': '5th Class'}, None),
+    (Student, {}, [('createdAt', -1), ('_id', -1)]),
+    (Student, {'campus': 'Yamuna'}, [('createdAt', -1), ('_id', -1)]),
+    (Teacher, {'teacherID': 'SUB-T001'}, None),
+    (Admin, {'username': 'admin'}, None),
+    (Submission, {'studentId': 'SUB-001', 'taskId': None}, None),
+    (Submission, {'studentId': 'SUB-001', 'taskId': {'$in': [None]}}, None),
+    (Submission, {'taskId': None}, None),
+    (Task, {'campusTarget': 'Yamuna', 'gradeTarget': '5th Class'}, None),
+    (Notification, {'targetUserType': 'teacher', 'targetCampus': 'Yamuna'}, [('createdAt', -1)]),
+    (Notification, {'targetUserType': 'student', 'targetCampus': 'Yamuna', 'targetGrade': '5th Class'}, [('createdAt', -1)]),
+    (Notification, {}, [('createdAt', -1)]),
+    (Notification, {'targetUserType': 'student', 'targetCampus': 'Yamuna', 'targetGrade': '5th Class', 'createdAt': {'$gt': datetime(1970, 1, 1)}}, None),
+    (NotificationReadState, {'userKey': 'student:SUB-001'}, None),
+    (LoginAttempt, {'key': {'$in': ['account:student:SUB-001', 'ip:127.0.0.1']}}, None),
+]
+
+def ensure_indexes():
+    """Create every declared index. Safe to run repeatedly; returns a list of failures."""
+    failures = []
+    for model in INDEXED_MODELS:
+        for index in model.indexes:
+            name = index.document['name']
+            try:
+                try:
+                    model.collection.create_indexes([index])
+                except OperationFailure as e:
+                    # A changed TTL is applied in place instead of rebuilding the index
+                    if e.code != INDEX_OPTIONS_CONFLICT or 'expireAfterSeconds' not in index.document:
+                        raise
+                    model.collection.database.command(
+                        'collMod', model.collection.name,
+                        index={'name': name, 'expireAfterSeconds': index.document['expireAfterSeconds']}
+                    )
+            except OperationFailure as e:
+                # e.g. existing duplicate IDs block a unique index
+                failures.append((model.collection.name, name, str(e)))
+                print(f"❌ Could not create index {model.collection.name}.{name}: {e}")
+    if not failures:
+        print("✅ Database indexes are up to date")
+    return failures
+
+def index_report():
+    """Compare declared indexes with the server: missing, undeclared and unused ones"""
+    report = []
+    for model in INDEXED_MODELS:
+        declared = {index.document['name'] for index in model.indexes}
+        existing = set(model.collection.index_information()) - {'_id_'}
+
+        usage = {}
+        try:
+            for stats in model.collection.aggregate([{'$indexStats': {}}]):
+                usage[stats['name']] = stats['accesses']['ops']
+        except OperationFailure:
+            pass  # $indexStats needs clusterMonitor on some deployments
+
+        report.append({
+            'collection': model.collection.name,
+            'missing': sorted(declared - existing),
+            'undeclared': sorted(existing - declared),
+            'unused': sorted(name for name in existing if usage.get(name) == 0)
+        })
+    return report
+
+def winning_stages(plan):
+    """Flatten the stage names of an explain() winning plan"""
+    stages = [plan.get('stage')]
+    if 'inputStage' in plan:
+        stages.extend(winning_stages(plan['inputStage']))
+    for child in plan.get('inputStages', []):
+        stages.extend(winning_stages(child))
+    if 'queryPlan' in plan:
+        stages.extend(winning_stages(plan['queryPlan']))
+    return stages
+
+def explain_hot_queries():
+    """Run explain() on the hot queries and check that each one is an IXSCAN"""
+    results = []
+    for model, query, sort in HOT_QUERIES:
+        cursor = model.collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = winning_stages(plan)
+        results.append({
+            'collection': model.collection.name,
+            'query': query,
+            'sort': sort,
+            'stages': stages,
+            'uses_index': 'IXSCAN' in stages and 'COLLSCAN' not in stages
+        })
+    return results
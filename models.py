@@ -1,44 +1,272 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from database import db
+from config import Config
+from events import notification_broker
+from workers import JobPool, QueueFull
 import bcrypt
+import copy
+import functools
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from bson.objectid import ObjectId
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+def hash_password(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(Config.BCRYPT_ROUNDS))
+
+# The one bcrypt pool: logins (auth.authenticate) and bulk imports share its
+# LOGIN_WORKERS threads instead of competing for the same cores
+bcrypt_pool = JobPool('bcrypt', Config.LOGIN_WORKERS, Config.LOGIN_QUEUE_LIMIT, keep_finished=0)
+
+def with_fields(projection, *fields):
+    """Add fields a method keys results on to an inclusion projection.
+    
+    None (whole documents) and exclusion projections already return them.
+    """
+    if projection and any(value for field, value in projection.items() if field != '_id'):
+        return dict(projection, **{field: 1 for field in fields})
+    return projection
+
+def grouped_counts(collection, fields, filters=None):
+    """Count matching documents per distinct value of fields with one $group.
+    
+    Returns {value: count} for a single field name, or {(value, ...): count}
+    for a list of fields. Values with no matching documents are absent.
+    """
+    single = isinstance(fields, str)
+    fields = [fields] if single else list(fields)
+    pipeline = [{'$match': filters}] if filters else []
+    pipeline.append({'$group': {'_id': {field: f'${field}' for field in fields}, 'count': {'$sum': 1}}})
+    counts = {}
+    for group in collection.aggregate(pipeline):
+        key = group['_id']
+        counts[key.get(fields[0]) if single else tuple(key.get(field) for field in fields)] = group['count']
+    return counts
+
+@functools.lru_cache(maxsize=1)
+def dummy_hash():
+    # Checked against for unknown users so they cost as much as known ones
+    return hash_password(os.urandom(16).hex())
+
+def check_password(password, password_hash):
+    """Return (matches, new hash). new hash is set when a matching hash was
+    made with a work factor other than BCRYPT_ROUNDS and should replace it."""
+    if isinstance(password_hash, str):
+        password_hash = password_hash.encode('utf-8')
+    if not bcrypt.checkpw(password.encode('utf-8'), password_hash):
+        return False, None
+    # Hashes look like $2b$12$<salt+digest>; the second field is the cost
+    if int(password_hash.split(b'$')[2]) != Config.BCRYPT_ROUNDS:
+        return True, hash_password(password)
+    return True, None
+
+def verify_login(model, id_field, user_id, password):
+    """Shared verify_password body: the user document on a match, else None"""
+    user = model.collection.find_one({id_field: user_id})
+    matches, new_hash = check_password(password, user['passwordHash'] if user else dummy_hash())
+    if not user or not matches:
+        return None
+    if new_hash:
+        # Conditional on the old hash so a concurrent password change wins
+        model.collection.update_one(
+            {id_field: user_id, 'passwordHash': user['passwordHash']},
+            {'$set': {'passwordHash': new_hash}}
+        )
+        user['passwordHash'] = new_hash
+    return user
+
+class UserCache:
+    """Short-lived in-process cache of signed-in users' documents.
+   
+    Request identity lookups go through here instead of querying Mongo on
+    every request. Teacher/Student update and delete drop the entry in this
+    process; other processes pick the change up within USER_CACHE_TTL.
+    """
+    entries = OrderedDict()
+    lock = threading.Lock()
+    generation = 0
+   
+    @classmethod
+    def get(cls, user_type, user_id):
+        """Copy of the teacher/student document (without passwordHash), or None"""
+        models = {'teacher': (Teacher, 'teacherID'), 'student': (Student, 'studentID')}
+        if user_type not in models or not user_id:
+            return None
+        key = (user_type, user_id)
+        now = time.monotonic()
+        with cls.lock:
+            entry = cls.entries.get(key)
+            if entry and entry[1] > now:
+                cls.entries.move_to_end(key)
+                return copy.deepcopy(entry[0])
+            generation = cls.generation
+       
+        model, id_field = models[user_type]
+        user = model.collection.find_one({id_field: user_id}, model.PUBLIC_FIELDS)
+        if user is None:
+            return None
+        with cls.lock:
+            # Skip the store if the user was invalidated while we were loading
+            if cls.generation == generation:
+                cls.entries[key] = (user, now + Config.USER_CACHE_TTL)
+                while len(cls.entries) > Config.USER_CACHE_SIZE:
+                    cls.entries.popitem(last=False)
+        return copy.deepcopy(user)
+   
+    @classmethod
+    def invalidate(cls, user_type, user_id):
+        with cls.lock:
+            cls.generation += 1
+            cls.entries.pop((user_type, user_id), None)
+
 class Student:
     collection = db.get_collection('students')
+    indexes = [
+        IndexModel([('studentID', ASCENDING)], name='studentID_unique', unique=True),
+        IndexModel([('campus', ASCENDING), ('grade', ASCENDING), ('section', ASCENDING)], name='campus_grade_section'),
+        # Page order; _id breaks ties between students bulk-created in one batch
+        IndexModel([('createdAt', DESCENDING), ('_id', DESCENDING)], name='createdAt_id_desc'),
+        IndexModel([('campus', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)], name='campus_createdAt_id')
+    ]
+    # Projections: everything but the password hash, and just what a roster table shows
+    PUBLIC_FIELDS = {'passwordHash': 0}
+    ROSTER_FIELDS = {'_id': 0, 'studentID': 1, 'name': 1, 'campus': 1, 'grade': 1, 'section': 1}
    
     @classmethod
     def create(cls, data):
         data['createdAt'] = datetime.utcnow()
-        data['passwordHash'] = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+        data['passwordHash'] = hash_password(data['password'])
         del data['password']
-        return cls.collection.insert_one(data)
+        result = cls.collection.insert_one(data)
+        ProgressStats.apply_student(data, 1)
+        return result
+   
+    @classmethod
+    def create_many(cls, records):
+        """Insert many students with one unordered insert_many.
+        
+        Each distinct password is hashed once on bcrypt_pool and its hash
+        shared by the records using it: imported students all start on the
+        default password, so a sheet costs one bcrypt rather than one per
+        row. Returns (inserted, errors) where errors maps a record's position
+        in `records` to an error message.
+        """
+        if not records:
+            return [], {}
+        
+        passwords = [record.pop('password') for record in records]
+        jobs = {}
+        for password in set(passwords):
+            try:
+                jobs[password] = bcrypt_pool.submit(hash_password, password)
+            except QueueFull:
+                jobs[password] = None
+        hashes = {}
+        for password, job in jobs.items():
+            if job is None:
+                hashes[password] = hash_password(password)
+                continue
+            job.done.wait()
+            if job.error is not None:
+                raise job.error
+            hashes[password] = job.result
+        password_hashes = [hashes[password] for password in passwords]
+        
+        created_at = datetime.utcnow()
+        for record, password_hash in zip(records, password_hashes):
+            record['passwordHash'] = password_hash
+            record['createdAt'] = created_at
+        
+        errors = {}
+        try:
+            cls.collection.insert_many(records, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') == 11000:
+                    errors[error['index']] = 'Student ID already exists'
+                else:
+                    errors[error['index']] = error.get('errmsg', 'Insert failed')
+        
+        inserted = [record for i, record in enumerate(records) if i not in errors]
+        ProgressStats.apply_students(inserted, 1)
+        return inserted, errors
    
     @classmethod
     def find_by_id(cls, student_id):
         return cls.collection.find_one({'studentID': student_id})
    
+    @classmethod
+    def find_many(cls, student_ids, projection=None):
+        """Resolve many studentIDs with a single $in query, keyed by studentID"""
+        student_ids = list(set(student_ids))
+        if not student_ids:
+            return {}
+        students = {}
+        projection = with_fields(projection, 'studentID')
+        for student in cls.collection.find({'studentID': {'$in': student_ids}}, projection):
+            students.setdefault(student['studentID'], student)
+        return students
+   
     @classmethod
     def verify_password(cls, student_id, password):
-        student = cls.find_by_id(student_id)
-        if student and bcrypt.checkpw(password.encode('utf-8'), student['passwordHash']):
-            return student
-        return None
+        return verify_login(cls, 'studentID', student_id, password)
    
     @classmethod
-    def get_by_campus_grade(cls, campus, grade):
-        return list(cls.collection.find({'campus': campus, 'grade': grade}))
+    def get_page(cls, filters=None, after=None, limit=50):
+        """One page of students, newest first, without password hashes.
+        
+        Keyset pagination on (createdAt, _id): after is the (createdAt, _id)
+        of the previous page's last student, so every page costs one indexed
+        range scan of limit + 1 documents. Returns (students, has_more).
+        """
+        query = dict(filters or {})
+        if after:
+            created_at, last_id = after
+            query['$or'] = [
+                {'createdAt': {'$lt': created_at}},
+                {'createdAt': created_at, '_id': {'$lt': last_id}}
+            ]
+        students = list(cls.collection.find(query, cls.PUBLIC_FIELDS)
+                        .sort([('createdAt', DESCENDING), ('_id', DESCENDING)])
+                        .limit(limit + 1))
+        return students[:limit], len(students) > limit
    
     @classmethod
-    def get_all(cls):
-        return list(cls.collection.find().sort('createdAt', -1))
+    def iter_export(cls, filters=None):
+        """Cursor over just the exported fields, newest first; documents stream in batches"""
+        return cls.collection.find(filters or {}, cls.ROSTER_FIELDS).sort('createdAt', -1)
    
     @classmethod
     def count_by_campus(cls, campus):
         return cls.collection.count_documents({'campus': campus})
    
+    @classmethod
+    def count_by(cls, fields, filters=None):
+        """Students per value of fields, e.g. count_by('grade', {'campus': campus}); see grouped_counts"""
+        return grouped_counts(cls.collection, fields, filters)
+   
     @classmethod
     def get_total_count(cls):
         return cls.collection.count_documents({})
    
+    @classmethod
+    def get_bucket_counts(cls):
+        """Count students per (campus, grade, section) bucket in a single $group"""
+        pipeline = [
+            {'$group': {
+                '_id': {'campus': '$campus', 'grade': '$grade', 'section': '$section'},
+                'count': {'$sum': 1}
+            }}
+        ]
+        return list(cls.collection.aggregate(pipeline))
+   
     @classmethod
     def get_by_campus_grade_section(cls, campus, grade, section):
         return list(cls.collection.find({
@@ -50,23 +278,48 @@ class Student:
     @classmethod
     def update(cls, student_id, data):
         if 'password' in data:
-            data['passwordHash'] = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+            data['passwordHash'] = hash_password(data['password'])
             del data['password']
-        return cls.collection.update_one(
+        # Moving a student between buckets moves their progress counters too
+        before = None
+        if any(field in data for field in ProgressStats.BUCKET_FIELDS):
+            before = cls.find_by_id(student_id)
+        result = cls.collection.update_one(
             {'studentID': student_id},
             {'$set': data}
         )
+        UserCache.invalidate('student', student_id)
+        if before and result.modified_count:
+            after = dict(before, **data)
+            if ProgressStats.bucket(before) != ProgressStats.bucket(after):
+                ProgressStats.apply_student(before, -1)
+                ProgressStats.apply_student(after, 1)
+        return result
    
     @classmethod
     def delete(cls, student_id):
-        return cls.collection.delete_one({'studentID': student_id})
+        student = cls.find_by_id(student_id)
+        result = cls.collection.delete_one({'studentID': student_id})
+        UserCache.invalidate('student', student_id)
+        if student and result.deleted_count:
+            ProgressStats.apply_student(student, -1)
+        return result
 class Task:
     collection = db.get_collection('tasks')
+    # campusTarget and gradeTarget are both arrays, and MongoDB cannot build a
+    # compound index over two array fields, so each gets its own multikey index.
+    indexes = [
+        IndexModel([('campusTarget', ASCENDING)], name='campusTarget'),
+        IndexModel([('gradeTarget', ASCENDING)], name='gradeTarget'),
+        IndexModel([('createdAt', DESCENDING)], name='createdAt_desc')
+    ]
    
     @classmethod
     def create(cls, data):
         data['createdAt'] = datetime.utcnow()
-        return cls.collection.insert_one(data)
+        result = cls.collection.insert_one(data)
+        ProgressStats.add_task(result.inserted_id)
+        return result
    
     @classmethod
     def find_by_id(cls, task_id):
@@ -88,47 +341,69 @@ class Task:
    
     @classmethod
     def delete(cls, task_id):
-        return cls.collection.delete_one({'_id': ObjectId(task_id)})
+        result = cls.collection.delete_one({'_id': ObjectId(task_id)})
+        if result.deleted_count:
+            ProgressStats.remove_task(ObjectId(task_id))
+        return result
    
     @classmethod
     def update(cls, task_id, data):
-        return cls.collection.update_one(
+        before = None
+        if 'description' in data:
+            before = cls.collection.find_one({'_id': ObjectId(task_id)}, {'description': 1})
+        result = cls.collection.update_one(
             {'_id': ObjectId(task_id)},
             {'$set': data}
         )
+        # Cached AI verdicts were judged against the old description
+        if before and before.get('description') != data['description']:
+            ValidationCache.invalidate_task(task_id)
+        return result
    
     @classmethod
     def get_total_count(cls):
         return cls.collection.count_documents({})
 class Submission:
     collection = db.get_collection('submissions')
+    indexes = [
+        IndexModel([('studentId', ASCENDING), ('taskId', ASCENDING)], name='studentId_taskId'),
+        IndexModel([('taskId', ASCENDING)], name='taskId')
+    ]
    
     @classmethod
     def create(cls, data):
         data['submittedAt'] = datetime.utcnow()
         data['status'] = 'completed'
-        return cls.collection.insert_one(data)
+        result = cls.collection.insert_one(data)
+        ProgressStats.record_submission(data['studentId'], data['taskId'])
+        return result
    
     @classmethod
-    def find_by_student_task(cls, student_id, task_id):
+    def find_by_student_task(cls, student_id, task_id, projection=None):
         try:
             return cls.collection.find_one({
                 'studentId': student_id,
                 'taskId': ObjectId(task_id)
-            })
+            }, projection)
         except:
             return None
    
     @classmethod
-    def get_by_student(cls, student_id):
-        return list(cls.collection.find({'studentId': student_id}))
-   
-    @classmethod
-    def get_task_completions(cls, task_id):
-        try:
-            return list(cls.collection.find({'taskId': ObjectId(task_id)}))
-        except:
-            return []
+    def get_submitted_at(cls, student_id, task_ids):
+        """First submission time per task for one student, from a single $in query.
+        
+        Returns {taskId: submittedAt}; tasks without a submission are absent.
+        """
+        submitted = {}
+        if not task_ids:
+            return submitted
+        submissions = cls.collection.find(
+            {'studentId': student_id, 'taskId': {'$in': list(task_ids)}},
+            {'_id': 0, 'taskId': 1, 'submittedAt': 1}
+        ).sort('submittedAt', ASCENDING)
+        for submission in submissions:
+            submitted.setdefault(submission['taskId'], submission.get('submittedAt'))
+        return submitted
    
     @classmethod
     def get_completion_count(cls, task_id):
@@ -138,26 +413,423 @@ class Submission:
             return 0
    
     @classmethod
-    def get_student_completions(cls, student_id):
-        return list(cls.collection.find({'studentId': student_id}))
+    def count_by(cls, fields, filters=None):
+        """Submissions per value of fields, e.g. per studentId for a page of students"""
+        return grouped_counts(cls.collection, fields, filters)
+   
+    @classmethod
+    def get_progress_counts(cls):
+        """Count submissions per task and per student (campus, grade, section, task) bucket.
+        
+        Both counts come from one $facet pipeline; the bucket side joins each
+        student's per-task submission totals onto the students collection with $lookup.
+        """
+        pipeline = [
+            {'$facet': {
+                'by_task': [
+                    {'$group': {'_id': '$taskId', 'count': {'$sum': 1}}}
+                ],
+                'by_bucket': [
+                    {'$group': {
+                        '_id': {'studentId': '$studentId', 'taskId': '$taskId'},
+                        'count': {'$sum': 1}
+                    }},
+                    {'$lookup': {
+                        'from': Student.collection.name,
+                        'localField': '_id.studentId',
+                        'foreignField': 'studentID',
+                        'as': 'student'
+                    }},
+                    {'$unwind': '$student'},
+                    {'$group': {
+                        '_id': {
+                            'campus': '$student.campus',
+                            'grade': '$student.grade',
+                            'section': '$student.section',
+                            'taskId': '$_id.taskId'
+                        },
+                        'count': {'$sum': '$count'}
+                    }}
+                ]
+            }}
+        ]
+        result = list(cls.collection.aggregate(pipeline))
+        if not result:
+            return {'by_task': [], 'by_bucket': []}
+        return result[0]
+   
+    @classmethod
+    def get_task_roster(cls, task, campus=None, after=None, completed_after=None, limit=None, projection=None):
+        """Split a task's students into completed and pending, optionally for one campus.
+        
+        Completed student IDs come from one distinct() on the taskId index.
+        Pending students are the task's targets (one $in query over its
+        campuses and grades) minus that set, anti-joined in Mongo with $nin.
+        Both lists are ordered by studentID and paged by keyset: pass the last
+        studentID of the previous page as after (pending) or completed_after
+        (completed). Returns a dict with completed, pending, completed_count,
+        pending_count, next_completed_after and next_after (None on the last page).
+        """
+        completed_ids = cls.collection.distinct('studentId', {'taskId': task['_id']})
+        
+        # The completed side pages over IDs only; Student.find_many loads the page
+        completed_filter = {'studentID': {'$in': completed_ids}}
+        if campus:
+            completed_filter['campus'] = campus
+        completed_page = sorted(Student.collection.distinct('studentID', completed_filter))
+        completed_count = len(completed_page)
+        if completed_after:
+            completed_page = [student_id for student_id in completed_page if student_id > completed_after]
+        next_completed_after = None
+        if limit and len(completed_page) > limit:
+            completed_page = completed_page[:limit]
+            next_completed_after = completed_page[-1]
+        students = Student.find_many(completed_page, projection)
+        completed = [students[student_id] for student_id in completed_page if student_id in students]
+        
+        campuses = [c for c in task.get('campusTarget', []) if not campus or c == campus]
+        pending_filter = {
+            'campus': {'$in': campuses},
+            'grade': {'$in': task.get('gradeTarget', [])},
+            'studentID': {'$nin': completed_ids}
+        }
+        pending_count = Student.collection.count_documents(pending_filter)
+        if after:
+            pending_filter['studentID'] = {'$nin': completed_ids, '$gt': after}
+        cursor = Student.collection.find(pending_filter, with_fields(projection, 'studentID')).sort('studentID', ASCENDING)
+        if limit:
+            cursor = cursor.limit(limit + 1)
+        pending = list(cursor)
+        
+        next_after = None
+        if limit and len(pending) > limit:
+            pending = pending[:limit]
+            next_after = pending[-1]['studentID']
+        return {
+            'completed': completed,
+            'pending': pending,
+            'completed_count': completed_count,
+            'pending_count': pending_count,
+            'next_completed_after': next_completed_after,
+            'next_after': next_after
+        }
+class ProgressStats:
+    """Materialized progress counters, kept in step with students, tasks and submissions.
+    
+    Three kinds of counter documents live in the collection:
+      - students:    {campus, grade, section} -> number of students
+      - submissions: {campus, grade, section, taskId} -> submissions by those students
+      - task:        {taskId} -> all submissions for the task
+    
+    plus one {kind: 'meta'} marker written by rebuild(). Reads never rebuild:
+    until the marker exists they fall back to the live aggregations, and the
+    counters are built by setup.py or `flask rebuild-progress`.
+    """
+    collection = db.get_collection('progress_stats')
+    indexes = [
+        # Unique: it is the upsert key, so racing upserts cannot split a counter.
+        # An existing non-unique index is replaced by `flask rebuild-progress`.
+        IndexModel([('kind', ASCENDING), ('campus', ASCENDING), ('grade', ASCENDING),
+                    ('section', ASCENDING), ('taskId', ASCENDING)], name='kind_bucket_task', unique=True),
+        IndexModel([('kind', ASCENDING), ('taskId', ASCENDING)], name='kind_taskId')
+    ]
+    BUCKET_FIELDS = ('campus', 'grade', 'section')
+    built = False
+    built_lock = threading.Lock()
+   
+    @classmethod
+    def bucket(cls, student):
+        return {field: student.get(field) for field in cls.BUCKET_FIELDS}
+   
+    @classmethod
+    def apply_student(cls, student, sign=1):
+        """Add (sign=1) or remove (sign=-1) a student and their submissions from its bucket"""
+        return cls.apply_students([student], sign)
+   
+    @classmethod
+    def apply_students(cls, students, sign=1):
+        """Add (sign=1) or remove (sign=-1) students and their submissions from their buckets"""
+        if not students:
+            return None
+        
+        student_counts = {}
+        buckets_by_id = {}
+        for student in students:
+            bucket = tuple(student.get(field) for field in cls.BUCKET_FIELDS)
+            student_counts[bucket] = student_counts.get(bucket, 0) + 1
+            buckets_by_id.setdefault(student['studentID'], []).append(bucket)
+        
+        submission_counts = {}
+        per_task = Submission.collection.aggregate([
+            {'$match': {'studentId': {'$in': list(buckets_by_id)}}},
+            {'$group': {
+                '_id': {'studentId': '$studentId', 'taskId': '$taskId'},
+                'count': {'$sum': 1}
+            }}
+        ])
+        for row in per_task:
+            for bucket in buckets_by_id[row['_id']['studentId']]:
+                key = (bucket, row['_id'].get('taskId'))
+                submission_counts[key] = submission_counts.get(key, 0) + row['count']
+        
+        operations = []
+        for bucket, count in student_counts.items():
+            operations.append(UpdateOne(
+                dict(zip(cls.BUCKET_FIELDS, bucket), kind='students'),
+                {'$inc': {'count': sign * count}},
+                upsert=True
+            ))
+        for (bucket, task_id), count in submission_counts.items():
+            operations.append(UpdateOne(
+                dict(zip(cls.BUCKET_FIELDS, bucket), kind='submissions', taskId=task_id),
+                {'$inc': {'count': sign * count}},
+                upsert=True
+            ))
+        return cls.collection.bulk_write(operations, ordered=False)
+   
+    @classmethod
+    def record_submission(cls, student_id, task_id):
+        operations = [
+            UpdateOne({'kind': 'task', 'taskId': task_id}, {'$inc': {'count': 1}}, upsert=True)
+        ]
+        projection = {field: 1 for field in cls.BUCKET_FIELDS}
+        for student in Student.collection.find({'studentID': student_id}, projection):
+            operations.append(UpdateOne(
+                dict(cls.bucket(student), kind='submissions', taskId=task_id),
+                {'$inc': {'count': 1}},
+                upsert=True
+            ))
+        return cls.collection.bulk_write(operations, ordered=False)
+   
+    @classmethod
+    def add_task(cls, task_id):
+        return cls.collection.update_one(
+            {'kind': 'task', 'taskId': task_id},
+            {'$setOnInsert': {'count': 0}},
+            upsert=True
+        )
+   
+    @classmethod
+    def remove_task(cls, task_id):
+        # Bucket submission counters are kept: per-student totals still include
+        # submissions for deleted tasks.
+        return cls.collection.delete_many({'kind': 'task', 'taskId': task_id})
+   
+    @classmethod
+    def is_built(cls):
+        """Whether rebuild() has written the counters; checked once per process"""
+        if cls.built:
+            return True
+        with cls.built_lock:
+            if not cls.built:
+                cls.built = cls.collection.find_one({'kind': 'meta'}, {'_id': 1}) is not None
+            return cls.built
+   
+    @classmethod
+    def ensure_built(cls):
+        """Rebuild if the counters were never built; for setup, not the read path"""
+        if cls.is_built():
+            return False
+        cls.rebuild()
+        return True
+   
+    @classmethod
+    def live_counts(cls):
+        """get_counts computed from students and submissions, for before the first rebuild"""
+        submission_counts = Submission.get_progress_counts()
+        by_bucket = {}
+        for bucket in submission_counts['by_bucket']:
+            key = tuple(bucket['_id'].get(field) for field in cls.BUCKET_FIELDS)
+            by_bucket[key] = by_bucket.get(key, 0) + bucket['count']
+        return {
+            'students': Student.get_bucket_counts(),
+            'by_bucket': [{'_id': dict(zip(cls.BUCKET_FIELDS, key)), 'count': count}
+                          for key, count in by_bucket.items()],
+            'by_task': submission_counts['by_task']
+        }
+   
+    @classmethod
+    def get_counts(cls):
+        """Read all counters in the shape returned by the live aggregation pipelines"""
+        if not cls.is_built():
+            return cls.live_counts()
+        bucket_id = {'campus': '$campus', 'grade': '$grade', 'section': '$section'}
+        pipeline = [
+            {'$facet': {
+                'students': [
+                    {'$match': {'kind': 'students', 'count': {'$gt': 0}}},
+                    {'$project': {'_id': bucket_id, 'count': 1}}
+                ],
+                'by_bucket': [
+                    {'$match': {'kind': 'submissions'}},
+                    {'$group': {'_id': bucket_id, 'count': {'$sum': '$count'}}}
+                ],
+                'by_task': [
+                    {'$match': {'kind': 'task'}},
+                    {'$project': {'_id': '$taskId', 'count': 1}}
+                ]
+            }}
+        ]
+        result = list(cls.collection.aggregate(pipeline))
+        if not result:
+            return {'students': [], 'by_bucket': [], 'by_task': []}
+        return result[0]
    
     @classmethod
-    def get_completed_students_for_task(cls, task_id):
-        """Get list of students who completed a specific task"""
-        completions = cls.get_task_completions(task_id)
-        completed_students = []
-        for completion in completions:
-            student = Student.find_by_id(completion['studentId'])
-            if student:
-                completed_students.append(student)
-        return completed_students
+    def get_task_counts(cls, task_ids, campus=None):
+        """Submissions per task, optionally by one campus's students, summed from the bucket counters"""
+        if not cls.is_built():
+            task_ids = set(task_ids)
+            counts = {}
+            for bucket in Submission.get_progress_counts()['by_bucket']:
+                task_id = bucket['_id'].get('taskId')
+                if task_id in task_ids and (not campus or bucket['_id'].get('campus') == campus):
+                    counts[task_id] = counts.get(task_id, 0) + bucket['count']
+            return counts
+        match = {'kind': 'submissions', 'taskId': {'$in': list(task_ids)}}
+        if campus:
+            match['campus'] = campus
+        pipeline = [
+            {'$match': match},
+            {'$group': {'_id': '$taskId', 'count': {'$sum': '$count'}}}
+        ]
+        return {group['_id']: group['count'] for group in cls.collection.aggregate(pipeline)}
+   
+    @classmethod
+    def rebuild(cls):
+        """Recompute every counter from scratch and swap it in to repair drift.
+        
+        Counters incremented while this runs are lost when the rebuilt
+        collection replaces the live one, so run it before serving traffic
+        or in a quiet window. Each run stages into its own collection, so
+        two overlapping rebuilds cannot trip over each other.
+        """
+        counters = []
+        for bucket in Student.get_bucket_counts():
+            counters.append(dict(cls.bucket(bucket['_id']), kind='students', count=bucket['count']))
+        submission_counts = Submission.get_progress_counts()
+        for bucket in submission_counts['by_bucket']:
+            counters.append(dict(cls.bucket(bucket['_id']), kind='submissions',
+                                 taskId=bucket['_id'].get('taskId'), count=bucket['count']))
+        task_ids = set()
+        for task in submission_counts['by_task']:
+            task_ids.add(task['_id'])
+            counters.append({'kind': 'task', 'taskId': task['_id'], 'count': task['count']})
+        for task in Task.collection.find({}, {'_id': 1}):
+            if task['_id'] not in task_ids:
+                counters.append({'kind': 'task', 'taskId': task['_id'], 'count': 0})
+        counters.append({'kind': 'meta', 'rebuiltAt': datetime.utcnow()})
+        
+        staging = db.get_collection(f'{cls.collection.name}_rebuild_{uuid.uuid4().hex}')
+        try:
+            # The rename replaces the live collection wholesale, indexes included
+            staging.create_indexes(cls.indexes)
+            staging.insert_many(counters)
+            staging.rename(cls.collection.name, dropTarget=True)
+        except Exception:
+            staging.drop()
+            raise
+        cls.built = True
+        return len(counters) - 1
+class ValidationCache:
+    """AI validation verdicts keyed by (normalized code, task description, model).
+    
+    Entries live in Mongo with a TTL and an in-process LRU in front. Every hit
+    is counted on the entry so saved API calls can be tracked.
+    """
+    collection = db.get_collection('validation_cache')
+    indexes = [
+        IndexModel([('createdAt', ASCENDING)], name='createdAt_ttl',
+                   expireAfterSeconds=Config.VALIDATION_CACHE_TTL),
+        IndexModel([('taskId', ASCENDING)], name='taskId')
+    ]
+    local = OrderedDict()
+    local_lock = threading.Lock()
+   
+    @classmethod
+    def make_key(cls, code, description, model):
+        lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        normalized = '\n'.join(line.rstrip() for line in lines).strip()
+        payload = json.dumps([normalized, (description or '').strip(), model])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+   
+    @classmethod
+    def remember(cls, key, entry):
+        with cls.local_lock:
+            cls.local[key] = entry
+            cls.local.move_to_end(key)
+            while len(cls.local) > Config.VALIDATION_CACHE_LOCAL_SIZE:
+                cls.local.popitem(last=False)
+   
+    @classmethod
+    def get(cls, key):
+        """Return the cached verdict for key, or None"""
+        with cls.local_lock:
+            entry = cls.local.get(key)
+            if entry and entry['expires'] < time.time():
+                del cls.local[key]
+                entry = None
+            if entry:
+                cls.local.move_to_end(key)
+        
+        hit = {'$inc': {'hits': 1}, '$set': {'lastHitAt': datetime.utcnow()}}
+        if entry:
+            cls.collection.update_one({'_id': key}, hit)
+            return entry['result']
+        
+        doc = cls.collection.find_one_and_update({'_id': key}, hit,
+                                                 projection={'result': 1, 'taskId': 1, 'createdAt': 1})
+        if not doc:
+            return None
+        age = (datetime.utcnow() - doc['createdAt']).total_seconds()
+        cls.remember(key, {
+            'result': doc['result'],
+            'taskId': doc.get('taskId'),
+            'expires': time.time() + Config.VALIDATION_CACHE_TTL - age
+        })
+        return doc['result']
+   
+    @classmethod
+    def put(cls, key, result, task_id=None, model=None):
+        task_id = str(task_id) if task_id else None
+        cls.collection.update_one(
+            {'_id': key},
+            {
+                '$set': {'result': result, 'taskId': task_id, 'model': model},
+                '$setOnInsert': {'createdAt': datetime.utcnow(), 'hits': 0}
+            },
+            upsert=True
+        )
+        cls.remember(key, {
+            'result': result,
+            'taskId': task_id,
+            'expires': time.time() + Config.VALIDATION_CACHE_TTL
+        })
+   
+    @classmethod
+    def invalidate_task(cls, task_id):
+        task_id = str(task_id)
+        with cls.local_lock:
+            for key in [k for k, entry in cls.local.items() if entry['taskId'] == task_id]:
+                del cls.local[key]
+        return cls.collection.delete_many({'taskId': task_id})
+   
+    @classmethod
+    def get_stats(cls):
+        """Entries and hits (API calls saved) per model"""
+        return list(cls.collection.aggregate([
+            {'$group': {'_id': '$model', 'entries': {'$sum': 1}, 'hits': {'$sum': '$hits'}}}
+        ]))
 class Admin:
     collection = db.get_collection('admins')
+    indexes = [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True)
+    ]
    
     @classmethod
     def create_default(cls):
         if cls.collection.count_documents({}) == 0:
-            password_hash = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
+            password_hash = hash_password('admin123')
             cls.collection.insert_one({
                 'username': 'admin',
                 'passwordHash': password_hash,
@@ -168,17 +840,90 @@ class Admin:
    
     @classmethod
     def verify_password(cls, username, password):
-        admin = cls.collection.find_one({'username': username})
-        if admin and bcrypt.checkpw(password.encode('utf-8'), admin['passwordHash']):
-            return admin
-        return None
+        return verify_login(cls, 'username', username, password)
+
+class JobRecord:
+    """Status of /python_run and /compile jobs, written by their JobPool.
+   
+    The pools run jobs in the process that accepted them; these records let
+    a poll that lands on any other gunicorn worker answer it. Finished jobs
+    expire after the pool's keep_finished, abandoned ones after keep_unfinished.
+    """
+    collection = db.get_collection('jobs')
+    indexes = [
+        IndexModel([('expiresAt', ASCENDING)], name='expiresAt_ttl', expireAfterSeconds=0)
+    ]
+
+class LoginAttempt:
+    """Failed login counters per account and per client IP, in fixed windows.
+   
+    Kept in Mongo so every worker process enforces the same limits; checking
+    them costs one indexed query, made before any bcrypt work.
+    """
+    collection = db.get_collection('login_attempts')
+    indexes = [
+        IndexModel([('key', ASCENDING)], name='key_unique', unique=True),
+        IndexModel([('expiresAt', ASCENDING)], name='expiresAt_ttl', expireAfterSeconds=0)
+    ]
+   
+    @classmethod
+    def limits(cls, user_type, username, ip):
+        """(key, max failures, window seconds) for the account and the IP"""
+        return [
+            (f'account:{user_type}:{username}', Config.LOGIN_ACCOUNT_MAX_FAILURES, Config.LOGIN_ACCOUNT_WINDOW),
+            (f'ip:{ip}', Config.LOGIN_IP_MAX_FAILURES, Config.LOGIN_IP_WINDOW)
+        ]
+   
+    @classmethod
+    def retry_after(cls, user_type, username, ip):
+        """Seconds until this login may be tried again, or 0 if it may be tried now"""
+        now = datetime.utcnow()
+        limits = {key: max_failures for key, max_failures, _ in cls.limits(user_type, username, ip)}
+        wait = 0
+        # The TTL monitor runs about once a minute, so expired windows are filtered here
+        for entry in cls.collection.find({'key': {'$in': list(limits)}, 'expiresAt': {'$gt': now}}):
+            if entry['count'] >= limits[entry['key']]:
+                wait = max(wait, (entry['expiresAt'] - now).total_seconds())
+        return math.ceil(wait)
+   
+    @classmethod
+    def record_failure(cls, user_type, username, ip):
+        now = datetime.utcnow()
+        for key, _, window in cls.limits(user_type, username, ip):
+            result = cls.collection.update_one(
+                {'key': key, 'expiresAt': {'$gt': now}},
+                {'$inc': {'count': 1}}
+            )
+            if result.matched_count:
+                continue
+            try:
+                # No live window: start a new one
+                cls.collection.update_one(
+                    {'key': key},
+                    {'$set': {'count': 1, 'expiresAt': now + timedelta(seconds=window)}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                pass  # A concurrent failure started it
+   
+    @classmethod
+    def clear(cls, user_type, username):
+        """Reset the account's counter after a successful login"""
+        cls.collection.delete_one({'key': f'account:{user_type}:{username}'})
+
 class Teacher:
     collection = db.get_collection('teachers')
+    indexes = [
+        IndexModel([('teacherID', ASCENDING)], name='teacherID_unique', unique=True),
+        IndexModel([('campus', ASCENDING)], name='campus'),
+        IndexModel([('createdAt', DESCENDING)], name='createdAt_desc')
+    ]
+    PUBLIC_FIELDS = {'passwordHash': 0}
    
     @classmethod
     def create(cls, data):
         data['createdAt'] = datetime.utcnow()
-        data['passwordHash'] = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+        data['passwordHash'] = hash_password(data['password'])
         del data['password']
         # Ensure permissions are explicitly set
         data['can_manage_students'] = data.get('can_manage_students', False)
@@ -191,18 +936,17 @@ class Teacher:
    
     @classmethod
     def verify_password(cls, teacher_id, password):
-        teacher = cls.find_by_id(teacher_id)
-        if teacher and bcrypt.checkpw(password.encode('utf-8'), teacher['passwordHash']):
-            return teacher
-        return None
+        return verify_login(cls, 'teacherID', teacher_id, password)
    
     @classmethod
-    def get_by_campus(cls, campus):
-        return list(cls.collection.find({'campus': campus}))
+    def get_all(cls, projection=None):
+        return list(cls.collection.find({}, projection).sort('createdAt', -1))
    
     @classmethod
-    def get_all(cls):
-        return list(cls.collection.find().sort('createdAt', -1))
+    def iter_export(cls):
+        """Cursor over just the exported fields, newest first; documents stream in batches"""
+        projection = {'_id': 0, 'teacherID': 1, 'name': 1, 'email': 1, 'campus': 1}
+        return cls.collection.find({}, projection).sort('createdAt', -1)
    
     @classmethod
     def count_by_campus(cls, campus):
@@ -215,21 +959,25 @@ class Teacher:
     @classmethod
     def update(cls, teacher_id, data):
         if 'password' in data:
-            data['passwordHash'] = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+            data['passwordHash'] = hash_password(data['password'])
             del data['password']
         # Update permissions if provided
         if 'can_manage_students' in data:
             data['can_manage_students'] = data['can_manage_students'] == 'on'
         if 'can_manage_tasks' in data:
             data['can_manage_tasks'] = data['can_manage_tasks'] == 'on'
-        return cls.collection.update_one(
+        result = cls.collection.update_one(
             {'teacherID': teacher_id},
             {'$set': data}
         )
+        UserCache.invalidate('teacher', teacher_id)
+        return result
    
     @classmethod
     def delete(cls, teacher_id):
-        return cls.collection.delete_one({'teacherID': teacher_id})
+        result = cls.collection.delete_one({'teacherID': teacher_id})
+        UserCache.invalidate('teacher', teacher_id)
+        return result
 class Campus:
     collection = db.get_collection('campuses')
    
@@ -269,124 +1017,210 @@ class Grade:
         return list(cls.collection.find().sort('level', 1))
 class Notification:
     collection = db.get_collection('notifications')
+    indexes = [
+        IndexModel([('targetUserType', ASCENDING), ('targetCampus', ASCENDING),
+                    ('targetGrade', ASCENDING), ('createdAt', DESCENDING)], name='target_createdAt'),
+        # Safety net behind the archive job; see NotificationArchive
+        IndexModel([('createdAt', DESCENDING)], name='createdAt_desc',
+                   expireAfterSeconds=Config.NOTIFICATION_TTL)
+    ]
+    unread_counts = OrderedDict()
+    unread_generations = {}
+    unread_lock = threading.Lock()
+    writer = JobPool('notification-writer', 1, Config.NOTIFICATION_WRITE_QUEUE_LIMIT, keep_finished=0)
    
     @classmethod
-    def create(cls, data):
-        data['createdAt'] = datetime.utcnow()
-        data['isRead'] = False
-        return cls.collection.insert_one(data)
+    def create_many(cls, notifications):
+        """Insert a fan-out of notifications with a single insert_many.
+       
+        With NOTIFICATION_BACKGROUND_WRITES the write is handed to a
+        background writer, so the request that triggered it does not wait
+        on the size of the audience. If the writer's queue is full the
+        batch is written inline instead.
+        """
+        if not notifications:
+            return
+        if Config.NOTIFICATION_BACKGROUND_WRITES:
+            try:
+                cls.writer.submit(cls.write_in_background, notifications)
+                return
+            except QueueFull:
+                pass
+        cls.write_many(notifications)
    
     @classmethod
-    def get_for_user(cls, user_type, user_id=None, campus=None, grade=None):
-        """Get notifications based on user type and access level"""
-        query = {}
-       
-        if user_type == 'admin':
-            # Admin gets all notifications
-            query = {}
-        elif user_type == 'teacher':
-            # Teachers get notifications for their campus
-            if campus:
-                query = {
-                    '$or': [
-                        {'targetUserType': 'teacher', 'targetCampus': campus},
-                        {'targetUserType': 'all_teachers'},
-                        {'targetUserType': 'admin_and_teachers'}
-                    ]
-                }
-        elif user_type == 'student':
-            # Students get notifications for their campus and grade
-            if campus and grade:
-                query = {
-                    '$or': [
-                        {'targetUserType': 'student', 'targetCampus': campus, 'targetGrade': grade},
-                        {'targetUserType': 'all_students'},
-                        {'targetUserType': 'admin_and_students'}
-                    ]
-                }
-       
-        return list(cls.collection.find(query).sort('createdAt', -1).limit(50))
+    def write_many(cls, notifications):
+        created_at = datetime.utcnow()
+        for notification in notifications:
+            notification['createdAt'] = created_at
+        cls.collection.insert_many(notifications, ordered=False)
+        for notification in notifications:
+            cls.invalidate_unread_counts(notification)
+            notification_broker.publish_local(notification)
    
     @classmethod
-    def get_unread_count(cls, user_type, user_id=None, campus=None, grade=None):
-        """Get count of unread notifications"""
-        query = {'isRead': False}
-       
-        if user_type == 'admin':
-            # Admin gets all notifications
-            pass
-        elif user_type == 'teacher':
+    def write_in_background(cls, notifications):
+        try:
+            cls.write_many(notifications)
+        except Exception as e:
+            print(f"❌ Error writing {len(notifications)} notifications: {e}")
+   
+    @staticmethod
+    def visible_to(notification, user_type, campus=None, grade=None):
+        """In-memory twin of the get_for_user filter, for pushed notifications"""
+        target = notification.get('targetUserType')
+        if user_type == 'teacher' and campus:
+            return (target in ('all_teachers', 'admin_and_teachers') or
+                    (target == 'teacher' and notification.get('targetCampus') == campus))
+        if user_type == 'student' and campus and grade:
+            return (target in ('all_students', 'admin_and_students') or
+                    (target == 'student' and notification.get('targetCampus') == campus and
+                     notification.get('targetGrade') == grade))
+        return True
+   
+    @staticmethod
+    def audience_filter(user_type, campus=None, grade=None):
+        """Query matching the notifications a user can see"""
+        if user_type == 'teacher' and campus:
             # Teachers get notifications for their campus
-            if campus:
-                query['$or'] = [
+            return {
+                '$or': [
                     {'targetUserType': 'teacher', 'targetCampus': campus},
                     {'targetUserType': 'all_teachers'},
                     {'targetUserType': 'admin_and_teachers'}
                 ]
-        elif user_type == 'student':
+            }
+        if user_type == 'student' and campus and grade:
             # Students get notifications for their campus and grade
-            if campus and grade:
-                query['$or'] = [
+            return {
+                '$or': [
                     {'targetUserType': 'student', 'targetCampus': campus, 'targetGrade': grade},
                     {'targetUserType': 'all_students'},
                     {'targetUserType': 'admin_and_students'}
                 ]
+            }
+        # Admin gets all notifications
+        return {}
+   
+    @classmethod
+    def get_for_user(cls, user_type, user_id=None, campus=None, grade=None, since=None):
+        """Get notifications based on user type and access level.
        
-        return cls.collection.count_documents(query)
+        With since (a createdAt), only notifications created at or after it
+        are returned; callers dedupe the overlap by _id.
+        """
+        query = cls.audience_filter(user_type, campus, grade)
+        if since:
+            query = dict(query, createdAt={'$gte': since})
+        return list(cls.collection.find(query).sort('createdAt', -1).limit(50))
    
     @classmethod
-    def mark_as_read(cls, notification_id, user_type, user_id=None, campus=None, grade=None):
-        """Mark a notification as read with access validation"""
-        query = {'_id': ObjectId(notification_id)}
+    def get_latest(cls, user_type, user_id=None, campus=None, grade=None):
+        """_id and createdAt of the newest notification a user can see, or None"""
+        query = cls.audience_filter(user_type, campus, grade)
+        return cls.collection.find_one(query, {'_id': 1, 'createdAt': 1}, sort=[('createdAt', -1)])
+   
+    @classmethod
+    def get_unread_count(cls, user_type, user_id=None, campus=None, grade=None, state=None):
+        """Count a user's unread notifications, cached briefly per user.
+       
+        Everything after the user's read watermark is unread except the
+        notifications they marked individually, so this is one indexed
+        range count however large the collection grows.
+        """
+        state = state or NotificationReadState.get(user_type, user_id)
+        key = (user_type, user_id, campus, grade)
+        audiences = cls.audience_keys(user_type, campus, grade)
+        now = time.monotonic()
+        with cls.unread_lock:
+            # Taken before counting, so a notification written meanwhile invalidates the result
+            generations = tuple(cls.unread_generations.get(audience, 0) for audience in audiences)
+            cached = cls.unread_counts.get(key)
+            if cached and cached[1] == state['version'] and cached[2] > now and cached[3] == generations:
+                cls.unread_counts.move_to_end(key)
+                return cached[0]
+            cls.unread_counts.pop(key, None)
        
-        # Add access control based on user type
+        query = dict(cls.audience_filter(user_type, campus, grade), createdAt={'$gt': state['readAllAt']})
+        if state['readIds']:
+            query['_id'] = {'$nin': state['readIds']}
+        count = cls.collection.count_documents(query)
+        with cls.unread_lock:
+            cls.unread_counts[key] = (count, state['version'], now + Config.NOTIFICATION_UNREAD_CACHE_TTL, generations)
+            while len(cls.unread_counts) > Config.NOTIFICATION_UNREAD_CACHE_SIZE:
+                cls.unread_counts.popitem(last=False)
+        return count
+   
+    @staticmethod
+    def audience_keys(user_type, campus=None, grade=None):
+        """Audiences whose new notifications a user sees, mirroring audience_filter"""
         if user_type == 'teacher' and campus:
-            query['$or'] = [
-                {'targetUserType': 'teacher', 'targetCampus': campus},
-                {'targetUserType': 'all_teachers'},
-                {'targetUserType': 'admin_and_teachers'}
-            ]
-        elif user_type == 'student' and campus and grade:
-            query['$or'] = [
-                {'targetUserType': 'student', 'targetCampus': campus, 'targetGrade': grade},
-                {'targetUserType': 'all_students'},
-                {'targetUserType': 'admin_and_students'}
-            ]
+            return [('teacher',), ('teacher', campus)]
+        if user_type == 'student' and campus and grade:
+            return [('student',), ('student', campus, grade)]
+        return [('all',)]
+   
+    @staticmethod
+    def notification_audiences(notification):
+        """Audiences that see a notification: everyone-seeing users plus its targets"""
+        target = notification.get('targetUserType')
+        audiences = [('all',)]
+        if target in ('all_teachers', 'admin_and_teachers'):
+            audiences.append(('teacher',))
+        elif target == 'teacher':
+            audiences.append(('teacher', notification.get('targetCampus')))
+        elif target in ('all_students', 'admin_and_students'):
+            audiences.append(('student',))
+        elif target == 'student':
+            audiences.append(('student', notification.get('targetCampus'), notification.get('targetGrade')))
+        return audiences
+   
+    @classmethod
+    def invalidate_unread_counts(cls, notification):
+        """Invalidate cached counts of every user who can see a new notification.
        
-        return cls.collection.update_one(query, {'$set': {'isRead': True}})
+        Bumps a generation per audience it reaches instead of scanning the
+        cache; counts taken under an older generation are recounted. Read
+        marks bump the user's state version instead, which invalidates
+        their count in every process at once.
+        """
+        with cls.unread_lock:
+            for audience in cls.notification_audiences(notification):
+                cls.unread_generations[audience] = cls.unread_generations.get(audience, 0) + 1
+   
+    @staticmethod
+    def annotate_read(notifications, state):
+        """Set each notification's isRead flag for the user owning state"""
+        read_ids = set(state['readIds'])
+        for notification in notifications:
+            notification['isRead'] = (notification['createdAt'] <= state['readAllAt'] or
+                                      notification['_id'] in read_ids)
+        return notifications
+   
+    @classmethod
+    def mark_as_read(cls, notification_id, user_type, user_id=None, campus=None, grade=None):
+        """Mark a notification as read for one user; False if they cannot see it"""
+        query = dict(cls.audience_filter(user_type, campus, grade), _id=ObjectId(notification_id))
+        notification = cls.collection.find_one(query, {'createdAt': 1})
+        if not notification:
+            return False
+        NotificationReadState.mark(user_type, user_id, notification)
+        return True
    
     @classmethod
     def mark_all_as_read(cls, user_type, user_id=None, campus=None, grade=None):
-        """Mark all notifications as read for a user"""
-        query = {'isRead': False}
-       
-        if user_type == 'admin':
-            # Admin gets all notifications
-            pass
-        elif user_type == 'teacher':
-            # Teachers get notifications for their campus
-            if campus:
-                query['$or'] = [
-                    {'targetUserType': 'teacher', 'targetCampus': campus},
-                    {'targetUserType': 'all_teachers'},
-                    {'targetUserType': 'admin_and_teachers'}
-                ]
-        elif user_type == 'student':
-            # Students get notifications for their campus and grade
-            if campus and grade:
-                query['$or'] = [
-                    {'targetUserType': 'student', 'targetCampus': campus, 'targetGrade': grade},
-                    {'targetUserType': 'all_students'},
-                    {'targetUserType': 'admin_and_students'}
-                ]
-       
-        return cls.collection.update_many(query, {'$set': {'isRead': True}})
+        """Mark all notifications as read for a user; returns how many were unread"""
+        count = cls.get_unread_count(user_type, user_id, campus, grade)
+        NotificationReadState.mark_all(user_type, user_id)
+        return count
    
     @classmethod
     def create_task_notification(cls, task, action="created"):
         """Create notification for a new/updated task"""
+        notifications = []
+       
         # Notify admin
-        cls.create({
+        notifications.append({
             'type': 'task',
             'title': f'Task {action.capitalize()}',
             'message': f'Task "{task["title"]}" has been {action}',
@@ -397,7 +1231,7 @@ class Notification:
        
         # Notify teachers in target campuses
         for campus in task.get('campusTarget', []):
-            cls.create({
+            notifications.append({
                 'type': 'task',
                 'title': f'New Task {action.capitalize()}',
                 'message': f'New task "{task["title"]}" has been {action} for {campus} campus',
@@ -409,7 +1243,7 @@ class Notification:
            
             # Notify students in target campuses and grades
             for grade in task.get('gradeTarget', []):
-                cls.create({
+                notifications.append({
                     'type': 'task',
                     'title': 'New Task Assigned',
                     'message': f'New task "{task["title"]}" has been assigned to your class',
@@ -419,12 +1253,16 @@ class Notification:
                     'targetGrade': grade,
                     'icon': 'fas fa-tasks'
                 })
+       
+        cls.create_many(notifications)
    
     @classmethod
     def create_student_notification(cls, student, action="added"):
         """Create notification for a new/updated student"""
+        notifications = []
+       
         # Notify admin
-        cls.create({
+        notifications.append({
             'type': 'student',
             'title': f'Student {action.capitalize()}',
             'message': f'Student "{student["name"]}" has been {action} to {student["campus"]} campus',
@@ -434,7 +1272,7 @@ class Notification:
         })
        
         # Notify teachers in the same campus
-        cls.create({
+        notifications.append({
             'type': 'student',
             'title': f'New Student {action.capitalize()}',
             'message': f'New student "{student["name"]}" has been {action} to your campus',
@@ -443,12 +1281,46 @@ class Notification:
             'targetCampus': student['campus'],
             'icon': 'fas fa-user-graduate'
         })
+       
+        cls.create_many(notifications)
+   
+    @classmethod
+    def create_import_notification(cls, students):
+        """Create one summary notification per bulk student import"""
+        notifications = []
+       
+        # Notify admin
+        notifications.append({
+            'type': 'student',
+            'title': 'Students Imported',
+            'message': f'{len(students)} students have been imported from Excel',
+            'targetUserType': 'admin',
+            'icon': 'fas fa-file-import'
+        })
+       
+        # Notify teachers of each campus that received students
+        campus_counts = {}
+        for student in students:
+            campus_counts[student['campus']] = campus_counts.get(student['campus'], 0) + 1
+        for campus, count in campus_counts.items():
+            notifications.append({
+                'type': 'student',
+                'title': 'New Students Imported',
+                'message': f'{count} new students have been imported to your campus',
+                'targetUserType': 'teacher',
+                'targetCampus': campus,
+                'icon': 'fas fa-file-import'
+            })
+       
+        cls.create_many(notifications)
    
     @classmethod
     def create_teacher_notification(cls, teacher, action="added"):
         """Create notification for a new/updated teacher"""
+        notifications = []
+       
         # Notify admin
-        cls.create({
+        notifications.append({
             'type': 'teacher',
             'title': f'Teacher {action.capitalize()}',
             'message': f'Teacher "{teacher["name"]}" has been {action} to {teacher["campus"]} campus',
@@ -456,12 +1328,16 @@ class Notification:
             'targetUserType': 'admin',
             'icon': 'fas fa-chalkboard-teacher'
         })
+       
+        cls.create_many(notifications)
    
     @classmethod
     def create_submission_notification(cls, submission, student, task):
         """Create notification for task submission"""
+        notifications = []
+       
         # Notify admin
-        cls.create({
+        notifications.append({
             'type': 'submission',
             'title': 'Task Submitted',
             'message': f'Student "{student["name"]}" submitted task "{task["title"]}"',
@@ -471,7 +1347,7 @@ class Notification:
         })
        
         # Notify teachers in the same campus
-        cls.create({
+        notifications.append({
             'type': 'submission',
             'title': 'Task Submission',
             'message': f'Student "{student["name"]}" submitted task "{task["title"]}"',
@@ -480,6 +1356,160 @@ class Notification:
             'targetCampus': student['campus'],
             'icon': 'fas fa-check-circle'
         })
+       
+        cls.create_many(notifications)
+
+class NotificationArchive:
+    """Compact long-term store for notifications moved out of the hot collection.
+   
+    archive() moves everything older than NOTIFICATION_ARCHIVE_AFTER in
+    batches, so the notifications collection stays small enough to sit in
+    the working set. Anything the job misses still expires through the
+    notifications TTL index.
+    """
+    collection = db.get_collection('notifications_archive')
+    indexes = [
+        IndexModel([('createdAt', ASCENDING)], name='createdAt_ttl',
+                   expireAfterSeconds=Config.NOTIFICATION_ARCHIVE_TTL),
+        IndexModel([('relatedId', ASCENDING)], name='relatedId')
+    ]
+    # Display-only fields (icon, legacy isRead) are dropped
+    FIELDS = ['type', 'title', 'message', 'relatedId', 'targetUserType', 'targetCampus', 'targetGrade', 'createdAt']
+   
+    @classmethod
+    def archive(cls, older_than=None, batch_size=None):
+        """Move old notifications into the archive; returns how many were moved"""
+        older_than = older_than if older_than is not None else Config.NOTIFICATION_ARCHIVE_AFTER
+        batch_size = batch_size or Config.NOTIFICATION_ARCHIVE_BATCH
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+        moved = 0
+       
+        while True:
+            batch = list(Notification.collection.find(
+                {'createdAt': {'$lt': cutoff}}, cls.FIELDS
+            ).sort('createdAt', 1).limit(batch_size))
+            if not batch:
+                return moved
+           
+            try:
+                cls.collection.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Documents archived by an interrupted earlier run are already there
+                if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                    raise
+            Notification.collection.delete_many({'_id': {'$in': [doc['_id'] for doc in batch]}})
+            moved += len(batch)
+
+class NotificationReadState:
+    """Per-user read state: a watermark plus a sparse set of later read marks.
+   
+    Notifications created at or before readAllAt are read; after it, only
+    the ids in readIds are. "Mark all as read" moves the watermark and
+    empties the set, so it is a single write however many notifications
+    the user can see. readIds keeps only the NOTIFICATION_READ_IDS_MAX
+    newest marks.
+    
+    Before this collection, isRead was one flag on each notification shared
+    by everyone; migrate_legacy() carries it over once (setup.py, init_app
+    or `flask migrate-read-state`).
+    """
+    collection = db.get_collection('notification_read_state')
+    indexes = [
+        IndexModel([('userKey', ASCENDING)], name='userKey_unique', unique=True)
+    ]
+    EPOCH = datetime(1970, 1, 1)
+    MIGRATED_KEY = 'meta:legacy-isRead'
+   
+    @staticmethod
+    def user_key(user_type, user_id):
+        return f'{user_type}:{user_id}'
+   
+    @classmethod
+    def get(cls, user_type, user_id):
+        state = cls.collection.find_one({'userKey': cls.user_key(user_type, user_id)})
+        if not state:
+            # Users who never read anything see every notification as unread
+            return {'readAllAt': cls.EPOCH, 'readIds': [], 'version': 0}
+        return state
+   
+    @classmethod
+    def update(cls, user_type, user_id, update):
+        key = cls.user_key(user_type, user_id)
+        try:
+            cls.collection.update_one({'userKey': key}, update, upsert=True)
+        except DuplicateKeyError:
+            # Two first-ever marks raced to insert the state; the loser updates it
+            cls.collection.update_one({'userKey': key}, update)
+   
+    @classmethod
+    def mark(cls, user_type, user_id, notification):
+        state = cls.get(user_type, user_id)
+        if notification['createdAt'] <= state['readAllAt'] or notification['_id'] in state['readIds']:
+            return
+        cls.update(user_type, user_id, {
+            # ObjectIds sort by creation, so the cap drops the oldest notifications' marks
+            '$push': {'readIds': {'$each': [notification['_id']], '$sort': 1,
+                                  '$slice': -Config.NOTIFICATION_READ_IDS_MAX}},
+            '$inc': {'version': 1},
+            '$setOnInsert': {'readAllAt': cls.EPOCH}
+        })
+   
+    @classmethod
+    def mark_all(cls, user_type, user_id):
+        cls.update(user_type, user_id, {
+            '$set': {'readAllAt': datetime.utcnow(), 'readIds': []},
+            '$inc': {'version': 1}
+        })
+   
+    @classmethod
+    def migrate_legacy(cls):
+        """Seed read state from the legacy isRead flags; returns how many users were seeded.
+        
+        Each user without a state gets readAllAt at the newest notification
+        they can see that was flagged read, so what they had read stays read
+        and everything after it stays unread. Users who already have a state
+        are left alone, so it is safe to run again.
+        """
+        watermarks = {}
+        
+        def watermark(user_type, campus=None, grade=None):
+            key = (user_type, campus, grade)
+            if key not in watermarks:
+                query = dict(Notification.audience_filter(user_type, campus, grade), isRead=True)
+                latest = Notification.collection.find_one(query, {'createdAt': 1}, sort=[('createdAt', -1)])
+                watermarks[key] = latest['createdAt'] if latest else cls.EPOCH
+            return watermarks[key]
+        
+        operations = []
+        for admin in Admin.collection.find({}, {'username': 1}):
+            operations.append(('admin', admin['username'], watermark('admin')))
+        for teacher in Teacher.collection.find({}, {'teacherID': 1, 'campus': 1}):
+            operations.append(('teacher', teacher['teacherID'], watermark('teacher', teacher.get('campus'))))
+        for student in Student.collection.find({}, {'studentID': 1, 'campus': 1, 'grade': 1}):
+            operations.append(('student', student['studentID'],
+                               watermark('student', student.get('campus'), student.get('grade'))))
+        
+        seeded = 0
+        for start in range(0, len(operations), 1000):
+            result = cls.collection.bulk_write([
+                UpdateOne({'userKey': cls.user_key(user_type, user_id)},
+                          {'$setOnInsert': {'readAllAt': read_all_at, 'readIds': [], 'version': 0}},
+                          upsert=True)
+                for user_type, user_id, read_all_at in operations[start:start + 1000]
+            ], ordered=False)
+            seeded += result.upserted_count
+        cls.collection.update_one({'userKey': cls.MIGRATED_KEY},
+                                  {'$set': {'migratedAt': datetime.utcnow()}}, upsert=True)
+        return seeded
+   
+    @classmethod
+    def ensure_migrated(cls):
+        """Run migrate_legacy once per database; returns True if it ran"""
+        if cls.collection.find_one({'userKey': cls.MIGRATED_KEY}, {'_id': 1}):
+            return False
+        cls.migrate_legacy()
+        return True
+
 # Initialize default data function
 def initialize_default_data():
     Admin.create_default()
@@ -1,30 +1,42 @@
-from flask import render_template, request, jsonify, redirect, url_for, session, send_file
+from flask import render_template, request, jsonify, redirect, url_for, session, send_file, Response, stream_with_context, current_app, g
 from functools import wraps
 import subprocess
 import tempfile
-import os
-import shutil
 import sys
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
 import pandas as pd
-from io import BytesIO
-import bcrypt
+from io import StringIO
+from openpyxl import Workbook
+import csv
+import hashlib
+import json
 import jwt
-import requests
+import queue
+import time
 from datetime import datetime, timedelta
 
-from database import db
 from config import Config
+from workers import QueueFull
+from ai_client import ai_client
+from auth import authenticate, LoginThrottled, LoginBusy
+from events import notification_broker, TooManySubscribers
+from sandbox import python_runner, run_python_code
+from compiler import compile_runner, compile_prepared, prepare_sketch, cached_result, invalidate_toolchain_fingerprint
 
 # Import models
-from models import Student, Task, Submission, Admin, Teacher, Campus, Grade, Notification, initialize_default_data
+from models import Student, Task, Submission, Teacher, Notification, NotificationReadState, ProgressStats, ValidationCache, UserCache, JobRecord, initialize_default_data
+
+# Job status lives in Mongo so a poll can land on any gunicorn worker
+python_runner.persist_to(JobRecord.collection)
+compile_runner.persist_to(JobRecord.collection)
 
 # Decorators
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        token = session.get('token')
-        if not token or not verify_token(token):
+        if not current_identity():
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
@@ -32,11 +44,10 @@ def login_required(f):
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        token = session.get('token')
-        if not token:
+        if not session.get('token'):
             return redirect(url_for('login'))
         
-        payload = verify_token(token)
+        payload = current_identity()
         if not payload or payload.get('user_type') != 'admin':
             return redirect(url_for('student_dashboard'))
         return f(*args, **kwargs)
@@ -45,11 +56,10 @@ def admin_required(f):
 def teacher_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        token = session.get('token')
-        if not token:
+        if not session.get('token'):
             return redirect(url_for('login'))
         
-        payload = verify_token(token)
+        payload = current_identity()
         if not payload or payload.get('user_type') != 'teacher':
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -73,6 +83,20 @@ def verify_token(token):
     except jwt.InvalidTokenError:
         return None
 
+def current_identity():
+    """Decoded session token for this request; decoded at most once"""
+    if 'identity' not in g:
+        token = session.get('token')
+        g.identity = verify_token(token) if token else None
+    return g.identity
+
+def current_user():
+    """Signed-in teacher or student document (None for admins), loaded once per request"""
+    if 'user' not in g:
+        identity = current_identity() or {}
+        g.user = UserCache.get(identity.get('user_type'), identity.get('user_id'))
+    return g.user
+
 def generate_student_id(campus, sequence):
     campus_prefix = {
         'Subhash Nagar': 'SUB',
@@ -89,103 +113,174 @@ def generate_teacher_id(campus, sequence):
     }.get(campus, 'TCH')
     return f"{campus_prefix}-T{sequence:03d}"
 
-def export_students_to_excel(students):
-    # Create DataFrame with student data including passwords
-    student_data = []
-    for s in students:
-        student_data.append({
-            'studentID': s['studentID'],
-            'name': s['name'],
-            'campus': s['campus'],
-            'grade': s['grade'],
-            'section': s.get('section', ''),
-            'password': '123456'  # Default password for all students
-        })
-    
-    df = pd.DataFrame(student_data)
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Students', index=False)
-        
-        # Add a info sheet with instructions
-        info_data = {
-            'Information': [
-                'This file contains student login credentials',
-                'All students have default password: 123456',
-                'Students should change their password after first login',
-                'Keep this file secure and do not share publicly'
-            ]
-        }
-        info_df = pd.DataFrame(info_data)
-        info_df.to_excel(writer, sheet_name='Instructions', index=False)
-    
+DEFAULT_PASSWORD = '123456'  # Default password for all imported students and teachers
+
+STUDENT_EXPORT_COLUMNS = ['studentID', 'name', 'campus', 'grade', 'section']
+TEACHER_EXPORT_COLUMNS = ['teacherID', 'name', 'email', 'campus']
+
+def export_rows(records, columns):
+    """Yield one row per record: the columns plus the default password"""
+    for record in records:
+        yield [record.get(column, '') for column in columns] + [DEFAULT_PASSWORD]
+
+def export_to_excel(records, columns, sheet_name, kind):
+    """Write records into an .xlsx temp file with openpyxl's write-only mode.
+    
+    Rows go straight from the Mongo cursor to disk, so memory stays flat
+    however large the roster is. Returns the file, rewound for send_file.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(columns + ['password'])
+    for row in export_rows(records, columns):
+        sheet.append(row)
+    
+    # Add a info sheet with instructions
+    info = workbook.create_sheet('Instructions')
+    info.append(['Information'])
+    for line in [
+        f'This file contains {kind} login credentials',
+        f'All {kind}s have default password: {DEFAULT_PASSWORD}',
+        f'{kind.capitalize()}s should change their password after first login',
+        'Keep this file secure and do not share publicly'
+    ]:
+        info.append([line])
+    
+    # Deleted when send_file closes it
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
     output.seek(0)
     return output
 
+def export_students_to_excel(students):
+    return export_to_excel(students, STUDENT_EXPORT_COLUMNS, 'Students', 'student')
+
 def export_teachers_to_excel(teachers):
-    # Create DataFrame with teacher data including passwords
-    teacher_data = []
-    for t in teachers:
-        teacher_data.append({
-            'teacherID': t['teacherID'],
-            'name': t['name'],
-            'email': t['email'],
-            'campus': t['campus'],
-            'password': '123456'  # Default password for all teachers
-        })
-    
-    df = pd.DataFrame(teacher_data)
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Teachers', index=False)
-        
-        # Add a info sheet with instructions
-        info_data = {
-            'Information': [
-                'This file contains teacher login credentials',
-                'All teachers have default password: 123456',
-                'Teachers should change their password after first login',
-                'Keep this file secure and do not share publicly'
-            ]
-        }
-        info_df = pd.DataFrame(info_data)
-        info_df.to_excel(writer, sheet_name='Instructions', index=False)
-    
-    output.seek(0)
-    return output
+    return export_to_excel(teachers, TEACHER_EXPORT_COLUMNS, 'Teachers', 'teacher')
+
+def export_to_csv(records, columns, download_name):
+    """Stream records as a CSV download, flushing every 500 rows"""
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns + ['password'])
+        for i, row in enumerate(export_rows(records, columns), 1):
+            writer.writerow(row)
+            if i % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    return response
 
 def import_students_from_excel(file):
+    """Build student records from an Excel sheet with vectorized pandas operations.
+    
+    Returns (students, rows, errors): the valid records, the sheet row number of
+    each record, and a per-row error report for rows that were skipped.
+    """
     try:
         df = pd.read_excel(file)
-        students = []
-        
-        for idx, row in df.iterrows():
-            student_id = generate_student_id(row['campus'], idx + 1)
-            student = {
-                'studentID': student_id,
-                'name': row['name'],
-                'campus': row['campus'],
-                'grade': row['grade'],
-                'section': row.get('section', 'LL'),
-                'password': '123456'  # Default password
-            }
-            students.append(student)
-        
-        return students
     except Exception as e:
         print(f"Error importing Excel: {e}")
-        return []
+        return [], [], [{'row': None, 'studentID': None, 'error': f'Could not read file: {e}'}]
+    
+    df.columns = [str(column).strip() for column in df.columns]
+    missing_columns = [c for c in ('name', 'campus', 'grade') if c not in df.columns]
+    if missing_columns:
+        return [], [], [{'row': None, 'studentID': None,
+                         'error': f"Missing column(s): {', '.join(missing_columns)}"}]
+    
+    def clean(column):
+        return df[column].astype('string').str.strip().replace('', pd.NA)
+    
+    campus_prefix = clean('campus').map({
+        'Subhash Nagar': 'SUB',
+        'Yamuna': 'YAM', 
+        'I20': 'I20'
+    }).fillna('STD')
+    sequence = pd.Series(df.index + 1, index=df.index).map('{:03d}'.format)
+    
+    records = pd.DataFrame({
+        'studentID': campus_prefix + '-' + sequence,
+        'name': clean('name'),
+        'campus': clean('campus'),
+        'grade': clean('grade'),
+        'section': clean('section').fillna('LL') if 'section' in df.columns else 'LL',
+        'password': DEFAULT_PASSWORD
+    })
+    records['row'] = df.index + 2  # Header is sheet row 1
+    
+    required = records[['name', 'campus', 'grade']]
+    invalid = required.isna().any(axis=1)
+    errors = [
+        {
+            'row': int(row['row']),
+            'studentID': row['studentID'],
+            'error': 'Missing ' + ', '.join(required.columns[required.loc[idx].isna()])
+        }
+        for idx, row in records[invalid].iterrows()
+    ]
+    
+    valid = records[~invalid].astype(object)
+    rows = [int(row) for row in valid.pop('row')]
+    return valid.to_dict('records'), rows, errors
+
+def completion_rate(completed, possible):
+    return round((completed / possible * 100), 2) if possible > 0 else 0
 
 def get_student_progress_data(campus=None):
     """Get comprehensive student progress data for admin/teacher dashboard"""
-    students = Student.get_all()
     tasks = Task.get_all()
-    
-    # Filter students by campus if provided
+    counts = ProgressStats.get_counts()
+    
+    return build_progress_data(tasks,
+                               counts['students'],
+                               counts['by_bucket'],
+                               counts['by_task'],
+                               campus)
+
+def build_progress_data(tasks, student_buckets, submission_buckets, task_completions, campus=None):
+    """Join per-bucket student/submission counts into the dashboard progress structure.
+    
+    Buckets are {'_id': {'campus', 'grade', 'section'}, 'count'} documents as
+    returned by ProgressStats.get_counts; task_completions is keyed by taskId.
+    """
+    def bucket_key(bucket):
+        key = bucket['_id'] or {}
+        return (key.get('campus'), key.get('grade'), key.get('section'))
+    
+    # (campus, grade, section) -> count, across all campuses
+    all_students = {}
+    for bucket in student_buckets:
+        key = bucket_key(bucket)
+        all_students[key] = all_students.get(key, 0) + bucket['count']
+    
+    all_submissions = {}
+    for bucket in submission_buckets:
+        key = bucket_key(bucket)
+        all_submissions[key] = all_submissions.get(key, 0) + bucket['count']
+    
+    completions_by_task = {c['_id']: c['count'] for c in task_completions}
+    
+    # Filter buckets by campus if provided
     if campus:
-        students = [s for s in students if s['campus'] == campus]
+        students = {k: v for k, v in all_students.items() if k[0] == campus}
+        submissions = {k: v for k, v in all_submissions.items() if k[0] == campus}
+    else:
+        students = all_students
+        submissions = all_submissions
+    
+    def total(counts, campus_name=None, grade=None, section=None):
+        return sum(count for (c, g, s), count in counts.items()
+                   if (campus_name is None or c == campus_name)
+                   and (grade is None or g == grade)
+                   and (section is None or s == section))
+    
+    total_students = sum(students.values())
     
     progress_data = {
         'campus_wise': {},
@@ -193,7 +288,7 @@ def get_student_progress_data(campus=None):
         'task_wise': {},
         'section_wise': {},
         'overall_stats': {
-            'total_students': len(students),
+            'total_students': total_students,
             'total_tasks': len(tasks),
             'total_submissions': 0,
             'completion_rate': 0
@@ -203,101 +298,81 @@ def get_student_progress_data(campus=None):
     # Campus-wise progress
     campuses = ['Subhash Nagar', 'Yamuna', 'I20']
     for campus_name in campuses:
-        campus_students = [s for s in students if s['campus'] == campus_name]
+        campus_students = total(students, campus_name=campus_name)
         campus_tasks = [t for t in tasks if campus_name in t.get('campusTarget', [])]
-        
-        total_possible_submissions = len(campus_students) * len(campus_tasks)
-        actual_submissions = 0
-        
-        for student in campus_students:
-            student_submissions = Submission.get_by_student(student['studentID'])
-            actual_submissions += len(student_submissions)
+        actual_submissions = total(submissions, campus_name=campus_name)
         
         progress_data['campus_wise'][campus_name] = {
-            'total_students': len(campus_students),
+            'total_students': campus_students,
             'total_tasks': len(campus_tasks),
             'completed_submissions': actual_submissions,
-            'completion_rate': round((actual_submissions / total_possible_submissions * 100), 2) if total_possible_submissions > 0 else 0
+            'completion_rate': completion_rate(actual_submissions, campus_students * len(campus_tasks))
         }
     
     # Grade-wise progress
     grades = [f"{i}th Class" for i in range(1, 11)]
     for grade in grades:
-        grade_students = [s for s in students if s['grade'] == grade]
+        grade_students = total(students, grade=grade)
         grade_tasks = [t for t in tasks if grade in t.get('gradeTarget', [])]
-        
-        total_possible_submissions = len(grade_students) * len(grade_tasks)
-        actual_submissions = 0
-        
-        for student in grade_students:
-            student_submissions = Submission.get_by_student(student['studentID'])
-            actual_submissions += len(student_submissions)
+        actual_submissions = total(submissions, grade=grade)
         
         progress_data['grade_wise'][grade] = {
-            'total_students': len(grade_students),
+            'total_students': grade_students,
             'total_tasks': len(grade_tasks),
             'completed_submissions': actual_submissions,
-            'completion_rate': round((actual_submissions / total_possible_submissions * 100), 2) if total_possible_submissions > 0 else 0
+            'completion_rate': completion_rate(actual_submissions, grade_students * len(grade_tasks))
         }
     
     # Section-wise progress
-    sections = [
-        'LL', 'HH', 'DD', 'FF', 
-        'Tata Boys', 'Tata Girls', 
-        'Google Boys', 'Google Girls', 
-        'Infosys Boys', 'Infosys Girls', 
-        'Adobe', 'Adobe Boys', 'Adobe Girls',
-        'Mahendra Boys', 'Mahendra Girls',
-        'Verizon Boys', 'Verizon Girls', 
-        'Microsoft Boys', 'Microsoft Girls'
-    ]
+    sections = STUDENT_SECTIONS
     
     for section in sections:
-        section_students = [s for s in students if s.get('section') == section]
+        section_students = total(students, section=section)
         if section_students:  # Only include sections that have students
-            total_possible_submissions = len(section_students) * len(tasks)
-            actual_submissions = 0
-            
-            for student in section_students:
-                student_submissions = Submission.get_by_student(student['studentID'])
-                actual_submissions += len(student_submissions)
+            actual_submissions = total(submissions, section=section)
             
             progress_data['section_wise'][section] = {
-                'total_students': len(section_students),
+                'total_students': section_students,
                 'total_tasks': len(tasks),
                 'completed_submissions': actual_submissions,
-                'completion_rate': round((actual_submissions / total_possible_submissions * 100), 2) if total_possible_submissions > 0 else 0
+                'completion_rate': completion_rate(actual_submissions, section_students * len(tasks))
             }
     
-    # Task-wise progress
+    # Task-wise progress (targets count students from every campus)
     for task in tasks:
-        completions = Submission.get_task_completions(str(task['_id']))
-        total_students = 0
+        completed = completions_by_task.get(task['_id'], 0)
+        target_students = 0
         for campus_name in task.get('campusTarget', []):
             for grade in task.get('gradeTarget', []):
-                students_count = len(Student.get_by_campus_grade(campus_name, grade))
-                total_students += students_count
+                target_students += total(all_students, campus_name=campus_name, grade=grade)
         
         progress_data['task_wise'][task['title']] = {
             'task_id': str(task['_id']),
-            'completed': len(completions),
-            'total_students': total_students,
-            'pending': total_students - len(completions),
-            'completion_rate': round((len(completions) / total_students * 100), 2) if total_students > 0 else 0
+            'completed': completed,
+            'total_students': target_students,
+            'pending': target_students - completed,
+            'completion_rate': completion_rate(completed, target_students)
         }
     
     # Overall stats
-    total_submissions = sum([len(Submission.get_by_student(s['studentID'])) for s in students])
-    total_possible_submissions = len(students) * len(tasks)
+    total_submissions = sum(submissions.values())
     
     progress_data['overall_stats']['total_submissions'] = total_submissions
-    progress_data['overall_stats']['completion_rate'] = round((total_submissions / total_possible_submissions * 100), 2) if total_possible_submissions > 0 else 0
+    progress_data['overall_stats']['completion_rate'] = completion_rate(total_submissions, total_students * len(tasks))
     
     return progress_data
 
 # AI Code Validation Function using OpenRouter
-def validate_student_code(student_code, task_description):
-    """Validate student code using OpenRouter AI"""
+def validate_student_code(student_code, task_description, task_id=None):
+    """Validate student code using OpenRouter AI, reusing cached verdicts"""
+    cache_key = ValidationCache.make_key(student_code, task_description, Config.OPENROUTER_MODEL)
+    try:
+        cached = ValidationCache.get(cache_key)
+        if cached:
+            return cached
+    except Exception as e:
+        print(f"Validation cache error: {e}")
+    
     try:
         user_prompt = f"""
 Task Description: {task_description}
@@ -313,77 +388,52 @@ Respond with ONLY one of these three options:
 
 Do not provide any additional explanation or text.
 """
-        payload = {
-            "model": Config.OPENROUTER_MODEL,
-            "messages": [
-                {
-                    "role": "system", 
-                    "content": """You are an expert code validation assistant. 
+        messages = [
+            {
+                "role": "system", 
+                "content": """You are an expert code validation assistant. 
                     Your task is to validate student code against task requirements.
                     Only respond with: "Correct", "Partially Correct", or "Incorrect".
                     Do not provide explanations, solutions, or additional text."""
-                },
-                {
-                    "role": "user", 
-                    "content": user_prompt
-                }
-            ]
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {Config.OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://taskboard.example.com",  # Optional, for OpenRouter tracking
-            "X-Title": "TaskBoard"  # Optional, for OpenRouter tracking
-        }
-        
-        response = requests.post(Config.OPENROUTER_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
+            },
+            {
+                "role": "user", 
+                "content": user_prompt
+            }
+        ]
         
-        data = response.json()
-        result = data["choices"][0]["message"]["content"].strip()
+        result = ai_client.complete(messages, purpose='validate')
+        if result in ("Correct", "Partially Correct", "Incorrect"):
+            ValidationCache.put(cache_key, result, task_id, Config.OPENROUTER_MODEL)
         return result
     except Exception as e:
         print(f"OpenRouter API error: {e}")
         return "Error"
 
-# AI Code Generation Function using OpenRouter
-def generate_code_with_ai(prompt, language="python"):
-    """Generate code using OpenRouter AI"""
-    try:
-        system_prompt = f"""
+def code_generation_messages(prompt, language="python"):
+    system_prompt = f"""
 You are an expert {language} programmer and educator. 
 Generate clean, well-commented code that solves the user's request.
 Focus on educational value and best practices.
 Only provide the code without explanations unless specifically asked.
 """
-        
-        payload = {
-            "model": Config.OPENROUTER_MODEL,
-            "messages": [
-                {
-                    "role": "system", 
-                    "content": system_prompt
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ]
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {Config.OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://taskboard.example.com",  # Optional, for OpenRouter tracking
-            "X-Title": "TaskBoard"  # Optional, for OpenRouter tracking
+    
+    return [
+        {
+            "role": "system", 
+            "content": system_prompt
+        },
+        {
+            "role": "user", 
+            "content": prompt
         }
-        
-        response = requests.post(Config.OPENROUTER_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        result = data["choices"][0]["message"]["content"].strip()
+    ]
+
+# AI Code Generation Function using OpenRouter
+def generate_code_with_ai(prompt, language="python"):
+    """Generate code using OpenRouter AI"""
+    try:
+        result = ai_client.complete(code_generation_messages(prompt, language), purpose='generate')
         return result
     except Exception as e:
         print(f"OpenRouter API error: {e}")
@@ -393,65 +443,107 @@ Only provide the code without explanations unless specifically asked.
 def chat_with_ai(messages):
     """Chat with OpenRouter AI"""
     try:
-        payload = {
-            "model": Config.OPENROUTER_MODEL,
-            "messages": messages
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {Config.OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://taskboard.example.com",  # Optional, for OpenRouter tracking
-            "X-Title": "TaskBoard"  # Optional, for OpenRouter tracking
-        }
-        
-        response = requests.post(Config.OPENROUTER_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        result = data["choices"][0]["message"]["content"].strip()
+        result = ai_client.complete(messages, purpose='chat')
         return result
     except Exception as e:
         print(f"OpenRouter API error: {e}")
         return f"Error: {str(e)}"
 
+def sse_event(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+def stream_ai_response(messages, purpose):
+    """Relay an OpenRouter completion to the browser as Server-Sent Events.
+
+    Each event carries {"status": "streaming", "token": ...}; the stream ends
+    with {"status": "success"} or {"status": "error", "message": ...}.
+    """
+    def generate():
+        try:
+            for token in ai_client.stream(messages, purpose=purpose):
+                yield sse_event({"status": "streaming", "token": token})
+            yield sse_event({"status": "success"})
+        except Exception as e:
+            print(f"OpenRouter API error: {e}")
+            yield sse_event({"status": "error", "message": str(e)})
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
 # Notification Routes
+def notification_audience():
+    """(user_type, user_id, campus, grade) used to filter the current user's notifications"""
+    payload = current_identity()
+    user_type = payload.get('user_type')
+    user_id = payload.get('user_id')
+    campus = None
+    grade = None
+    
+    user = current_user()
+    if user and user_type == 'teacher':
+        campus = user['campus']
+    elif user and user_type == 'student':
+        campus = user['campus']
+        grade = user['grade']
+    
+    return user_type, user_id, campus, grade
+
+def serialize_notification(notification):
+    # Convert ObjectId to string for JSON serialization
+    notification = dict(notification)
+    notification['_id'] = str(notification['_id'])
+    if 'relatedId' in notification:
+        notification['relatedId'] = str(notification['relatedId'])
+    return notification
+
+EPOCH = datetime(1970, 1, 1)
+
+def encode_time_cursor(moment):
+    """Opaque cursor for a datetime: epoch milliseconds"""
+    return str(int((moment - EPOCH).total_seconds() * 1000))
+
+def decode_time_cursor(cursor):
+    return EPOCH + timedelta(milliseconds=int(cursor)) if cursor else None
+
 @login_required
 def get_notifications():
-    """Get notifications for current user"""
+    """Get notifications for current user.
+    
+    With ?since=<cursor from an earlier response> only newer notifications
+    are returned. Responses carry an ETag, so a poll that would return the
+    same thing is answered with 304 after one indexed lookup.
+    """
     try:
-        token = session.get('token')
-        payload = verify_token(token)
-        user_type = payload.get('user_type')
-        user_id = payload.get('user_id')
-        
-        # Get user-specific data for filtering
-        campus = None
-        grade = None
-        
-        if user_type == 'teacher':
-            teacher = Teacher.find_by_id(user_id)
-            if teacher:
-                campus = teacher['campus']
-        elif user_type == 'student':
-            student = Student.find_by_id(user_id)
-            if student:
-                campus = student['campus']
-                grade = student['grade']
-        
-        notifications = Notification.get_for_user(user_type, user_id, campus, grade)
-        
-        # Convert ObjectId to string for JSON serialization
-        for notification in notifications:
-            notification['_id'] = str(notification['_id'])
-            if 'relatedId' in notification:
-                notification['relatedId'] = str(notification['relatedId'])
-        
-        return jsonify({
-            'status': 'success',
-            'notifications': notifications,
-            'unread_count': Notification.get_unread_count(user_type, user_id, campus, grade)
-        })
+        user_type, user_id, campus, grade = notification_audience()
+        since = request.args.get('since', '')
+        try:
+            since_date = decode_time_cursor(since)
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Invalid since cursor'})
+        
+        read_state = NotificationReadState.get(user_type, user_id)
+        latest = Notification.get_latest(user_type, user_id, campus, grade)
+        unread_count = Notification.get_unread_count(user_type, user_id, campus, grade, state=read_state)
+        
+        state = (f"{user_type}|{user_id}|{campus}|{grade}|{since}|{latest and latest['_id']}|"
+                 f"{read_state['version']}|{unread_count}")
+        etag = hashlib.sha1(state.encode('utf-8')).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            notifications = Notification.get_for_user(user_type, user_id, campus, grade, since=since_date)
+            Notification.annotate_read(notifications, read_state)
+            response = jsonify({
+                'status': 'success',
+                'notifications': [serialize_notification(n) for n in notifications],
+                'unread_count': unread_count,
+                'cursor': encode_time_cursor(latest['createdAt']) if latest else since
+            })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -460,28 +552,9 @@ def get_notifications():
 def mark_notification_read(notification_id):
     """Mark a notification as read"""
     try:
-        token = session.get('token')
-        payload = verify_token(token)
-        user_type = payload.get('user_type')
-        user_id = payload.get('user_id')
+        user_type, user_id, campus, grade = notification_audience()
         
-        # Get user-specific data for access control
-        campus = None
-        grade = None
-        
-        if user_type == 'teacher':
-            teacher = Teacher.find_by_id(user_id)
-            if teacher:
-                campus = teacher['campus']
-        elif user_type == 'student':
-            student = Student.find_by_id(user_id)
-            if student:
-                campus = student['campus']
-                grade = student['grade']
-        
-        result = Notification.mark_as_read(notification_id, user_type, user_id, campus, grade)
-        
-        if result.modified_count > 0:
+        if Notification.mark_as_read(notification_id, user_type, user_id, campus, grade):
             return jsonify({'status': 'success', 'message': 'Notification marked as read'})
         else:
             return jsonify({'status': 'error', 'message': 'Notification not found or access denied'})
@@ -493,71 +566,105 @@ def mark_notification_read(notification_id):
 def mark_all_notifications_read():
     """Mark all notifications as read for current user"""
     try:
-        token = session.get('token')
-        payload = verify_token(token)
-        user_type = payload.get('user_type')
-        user_id = payload.get('user_id')
-        
-        # Get user-specific data for access control
-        campus = None
-        grade = None
+        user_type, user_id, campus, grade = notification_audience()
         
-        if user_type == 'teacher':
-            teacher = Teacher.find_by_id(user_id)
-            if teacher:
-                campus = teacher['campus']
-        elif user_type == 'student':
-            student = Student.find_by_id(user_id)
-            if student:
-                campus = student['campus']
-                grade = student['grade']
-        
-        result = Notification.mark_all_as_read(user_type, user_id, campus, grade)
+        count = Notification.mark_all_as_read(user_type, user_id, campus, grade)
         
         return jsonify({
             'status': 'success', 
-            'message': f'{result.modified_count} notifications marked as read'
+            'message': f'{count} notifications marked as read'
         })
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+@login_required
+def notification_stream():
+    """Push new notifications to the page as Server-Sent Events.
+
+    Pages load the list once per connection and then only receive
+    "notification" events. The stream closes after
+    NOTIFICATION_STREAM_MAX_AGE so EventSource reconnects and re-checks
+    the session.
+    """
+    user_type, user_id, campus, grade = notification_audience()
+    try:
+        subscriber = notification_broker.subscribe(
+            lambda doc: Notification.visible_to(doc, user_type, campus, grade))
+    except TooManySubscribers:
+        # The page falls back to polling until a slot frees up
+        return jsonify({'status': 'error', 'message': 'Too many open notification streams'}), 503
+    
+    def generate():
+        deadline = time.monotonic() + Config.NOTIFICATION_STREAM_MAX_AGE
+        # Sent at once so the browser sees the stream open
+        yield "retry: 5000\n: connected\n\n"
+        while time.monotonic() < deadline:
+            if subscriber.overflowed:
+                # Too far behind to replay; the page reloads its list instead
+                yield "event: reload\ndata: {}\n\n"
+                break
+            try:
+                notification = subscriber.queue.get(timeout=Config.NOTIFICATION_STREAM_HEARTBEAT)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            yield f"event: notification\ndata: {current_app.json.dumps(serialize_notification(notification))}\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Unsubscribe even if the client disconnects before the stream starts
+    response.call_on_close(lambda: notification_broker.unsubscribe(subscriber))
+    return response
+
 # Auth Routes
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         user_type = request.form.get('user_type')
+        if user_type not in ('admin', 'teacher'):
+            user_type = 'student'
+        
+        if not username or not password:
+            return render_template('login.html', error='Invalid credentials')
+        
+        try:
+            user = authenticate(user_type, username, password, request.remote_addr)
+        except LoginThrottled as e:
+            response = current_app.make_response((render_template('login.html', error=str(e)), 429))
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        except LoginBusy as e:
+            response = current_app.make_response((render_template('login.html', error=str(e)), 503))
+            response.headers['Retry-After'] = '2'
+            return response
+        
+        if not user:
+            return render_template('login.html', error='Invalid credentials')
         
         if user_type == 'admin':
-            admin = Admin.verify_password(username, password)
-            if admin:
-                token = create_token(admin['username'], 'admin')
-                session['token'] = token
-                session['user_type'] = 'admin'
-                session['username'] = admin['username']
-                return redirect(url_for('admin_dashboard'))
+            token = create_token(user['username'], 'admin')
+            session['token'] = token
+            session['user_type'] = 'admin'
+            session['username'] = user['username']
+            return redirect(url_for('admin_dashboard'))
         elif user_type == 'teacher':
-            teacher = Teacher.verify_password(username, password)
-            if teacher:
-                token = create_token(teacher['teacherID'], 'teacher')
-                session['token'] = token
-                session['user_type'] = 'teacher'
-                session['teacher_id'] = teacher['teacherID']
-                session['teacher_name'] = teacher['name']
-                session['teacher_campus'] = teacher['campus']
-                return redirect(url_for('teacher_dashboard'))
+            token = create_token(user['teacherID'], 'teacher')
+            session['token'] = token
+            session['user_type'] = 'teacher'
+            session['teacher_id'] = user['teacherID']
+            session['teacher_name'] = user['name']
+            session['teacher_campus'] = user['campus']
+            return redirect(url_for('teacher_dashboard'))
         else:
-            student = Student.verify_password(username, password)
-            if student:
-                token = create_token(student['studentID'], 'student')
-                session['token'] = token
-                session['user_type'] = 'student'
-                session['student_id'] = student['studentID']
-                session['student_name'] = student['name']
-                return redirect(url_for('student_dashboard'))
-        
-        return render_template('login.html', error='Invalid credentials')
+            token = create_token(user['studentID'], 'student')
+            session['token'] = token
+            session['user_type'] = 'student'
+            session['student_id'] = user['studentID']
+            session['student_name'] = user['name']
+            return redirect(url_for('student_dashboard'))
     
     return render_template('login.html')
 
@@ -572,33 +679,95 @@ def admin_dashboard():
     
     # Get notifications for admin
     notifications = Notification.get_for_user('admin')
-    unread_count = Notification.get_unread_count('admin')
+    unread_count = Notification.get_unread_count('admin', session.get('username'))
     
     return render_template('admin_dashboard.html', 
                          progress_data=progress_data,
                          notifications=notifications[:5],  # Show only 5 recent
                          unread_count=unread_count)
 
+STUDENT_FILTERS = ('campus', 'grade', 'section')
+
+STUDENT_SECTIONS = [
+    'LL', 'HH', 'DD', 'FF', 
+    'Tata Boys', 'Tata Girls', 
+    'Google Boys', 'Google Girls', 
+    'Infosys Boys', 'Infosys Girls', 
+    'Adobe', 'Adobe Boys', 'Adobe Girls',
+    'Mahendra Boys', 'Mahendra Girls',
+    'Verizon Boys', 'Verizon Girls', 
+    'Microsoft Boys', 'Microsoft Girls'
+]
+
+def student_page_cursor(student):
+    """Opaque ?cursor= value for the page after this student: '<createdAt ms>.<_id>'"""
+    return f"{encode_time_cursor(student['createdAt'])}.{student['_id']}"
+
+def parse_student_page_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        created_at, student_id = cursor.split('.')
+        return decode_time_cursor(created_at), ObjectId(student_id)
+    except (ValueError, InvalidId):
+        raise ValueError('Invalid cursor')
+
+def student_page(filters):
+    """Apply ?campus/?grade/?section and ?cursor/?limit to Student.get_page.
+    
+    Keys already in filters (e.g. a teacher's campus) cannot be overridden.
+    Returns (students, filters, next cursor or None).
+    """
+    filters = dict(filters)
+    for field in STUDENT_FILTERS:
+        value = request.args.get(field)
+        if value:
+            filters.setdefault(field, value)
+    limit = request.args.get('limit', type=int) or Config.STUDENT_PAGE_SIZE
+    limit = max(1, min(limit, Config.STUDENT_PAGE_MAX_SIZE))
+    
+    after = parse_student_page_cursor(request.args.get('cursor'))
+    students, has_more = Student.get_page(filters, after=after, limit=limit)
+    next_cursor = student_page_cursor(students[-1]) if has_more else None
+    return students, filters, next_cursor
+
+def serialize_student(student):
+    student = dict(student)
+    student['_id'] = str(student['_id'])
+    if student.get('createdAt'):
+        student['createdAt'] = student['createdAt'].isoformat()
+    return student
+
+def student_rows_response(template, students, next_cursor, **context):
+    """JSON page for infinite scroll: the rendered table rows plus the raw records"""
+    return jsonify({
+        'status': 'success',
+        'html': render_template(template, students=students, **context),
+        'students': [serialize_student(s) for s in students],
+        'next_cursor': next_cursor
+    })
+
 @admin_required
 def manage_students():
-    students = Student.get_all()
-    # Convert ObjectId to string for template
-    for student in students:
-        student['_id'] = str(student['_id'])
-    return render_template('manage_students.html', students=students)
+    try:
+        students, filters, next_cursor = student_page({})
+    except ValueError:
+        return redirect(url_for('manage_students'))
+    return render_template('manage_students.html', students=students, filters=filters,
+                           next_cursor=next_cursor, sections=STUDENT_SECTIONS)
+
+@admin_required
+def manage_students_page():
+    """JSON endpoint behind the student table's infinite scroll"""
+    try:
+        students, _, next_cursor = student_page({})
+        return student_rows_response('student_rows.html', students, next_cursor)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
 
 @admin_required
 def add_student():
-    sections = [
-        'LL', 'HH', 'DD', 'FF', 
-        'Tata Boys', 'Tata Girls', 
-        'Google Boys', 'Google Girls', 
-        'Infosys Boys', 'Infosys Girls', 
-        'Adobe', 'Adobe Boys', 'Adobe Girls',
-        'Mahendra Boys', 'Mahendra Girls',
-        'Verizon Boys', 'Verizon Girls', 
-        'Microsoft Boys', 'Microsoft Girls'
-    ]
+    sections = STUDENT_SECTIONS
     
     if request.method == 'POST':
         data = {
@@ -607,10 +776,13 @@ def add_student():
             'campus': request.form.get('campus'),
             'grade': request.form.get('grade'),
             'section': request.form.get('section'),
-            'password': request.form.get('password', '123456')
+            'password': request.form.get('password', DEFAULT_PASSWORD)
         }
         
-        result = Student.create(data)
+        try:
+            result = Student.create(data)
+        except DuplicateKeyError:
+            return render_template('add_student.html', error='A student with this ID already exists', sections=sections)
         if result:
             # Get the created student to create notification
             student = Student.find_by_id(data['studentID'])
@@ -629,16 +801,7 @@ def edit_student(student_id):
     if not student:
         return redirect(url_for('manage_students'))
     
-    sections = [
-        'LL', 'HH', 'DD', 'FF', 
-        'Tata Boys', 'Tata Girls', 
-        'Google Boys', 'Google Girls', 
-        'Infosys Boys', 'Infosys Girls', 
-        'Adobe', 'Adobe Boys', 'Adobe Girls',
-        'Mahendra Boys', 'Mahendra Girls',
-        'Verizon Boys', 'Verizon Girls', 
-        'Microsoft Boys', 'Microsoft Girls'
-    ]
+    sections = STUDENT_SECTIONS
     
     if request.method == 'POST':
         data = {
@@ -683,27 +846,35 @@ def upload_students():
             return redirect(url_for('manage_students'))
         
         if file and file.filename.endswith('.xlsx'):
-            students_data = import_students_from_excel(file)
-            success_count = 0
-            for student_data in students_data:
-                try:
-                    Student.create(student_data)
-                    success_count += 1
-                    # Create notification for each student
-                    student = Student.find_by_id(student_data['studentID'])
-                    if student:
-                        Notification.create_student_notification(student, "added")
-                except Exception as e:
-                    print(f"Error creating student: {e}")
+            students_data, rows, errors = import_students_from_excel(file)
+            inserted, insert_errors = Student.create_many(students_data)
+            for index, message in insert_errors.items():
+                errors.append({'row': rows[index], 'studentID': students_data[index]['studentID'], 'error': message})
+            errors.sort(key=lambda error: error['row'] or 0)
             
-            print(f"Successfully imported {success_count} students")
-            return redirect(url_for('manage_students'))
+            # One summary notification per import rather than per student
+            if inserted:
+                Notification.create_import_notification(inserted)
+            
+            print(f"Successfully imported {len(inserted)} students")
+            import_report = {'imported': len(inserted), 'failed': len(errors), 'errors': errors}
+            
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify({'status': 'success', **import_report})
+            
+            students, filters, next_cursor = student_page({})
+            return render_template('manage_students.html', students=students, filters=filters,
+                                   next_cursor=next_cursor, sections=STUDENT_SECTIONS,
+                                   import_report=import_report)
     
     return redirect(url_for('manage_students'))
 
 @admin_required
 def export_students():
-    students = Student.get_all()
+    """Download every student as .xlsx, or as streamed CSV with ?format=csv"""
+    students = Student.iter_export()
+    if request.args.get('format') == 'csv':
+        return export_to_csv(students, STUDENT_EXPORT_COLUMNS, 'students_with_passwords.csv')
     excel_file = export_students_to_excel(students)
     return send_file(excel_file, 
                     download_name='students_with_passwords.xlsx',
@@ -711,7 +882,7 @@ def export_students():
 
 @admin_required
 def manage_teachers():
-    teachers = Teacher.get_all()
+    teachers = Teacher.get_all(projection=Teacher.PUBLIC_FIELDS)
     # Convert ObjectId to string for template
     for teacher in teachers:
         teacher['_id'] = str(teacher['_id'])
@@ -724,20 +895,22 @@ def add_teacher():
     if request.method == 'POST':
         # Get the count of existing teachers for this campus to generate ID
         campus = request.form.get('campus')
-        existing_teachers = Teacher.get_by_campus(campus)
-        sequence = len(existing_teachers) + 1
+        sequence = Teacher.count_by_campus(campus) + 1
         
         data = {
             'teacherID': generate_teacher_id(campus, sequence),
             'name': request.form.get('name'),
             'email': request.form.get('email'),
             'campus': campus,
-            'password': request.form.get('password', '123456'),
+            'password': request.form.get('password', DEFAULT_PASSWORD),
             'can_manage_students': request.form.get('can_manage_students') == 'on',
             'can_manage_tasks': request.form.get('can_manage_tasks') == 'on'
         }
         
-        result = Teacher.create(data)
+        try:
+            result = Teacher.create(data)
+        except DuplicateKeyError:
+            return render_template('add_teacher.html', error='A teacher with this ID already exists', campuses=campuses)
         if result:
             # Get the created teacher to create notification
             teacher = Teacher.find_by_id(data['teacherID'])
@@ -793,7 +966,10 @@ def delete_teacher(teacher_id):
 
 @admin_required
 def export_teachers():
-    teachers = Teacher.get_all()
+    """Download every teacher as .xlsx, or as streamed CSV with ?format=csv"""
+    teachers = Teacher.iter_export()
+    if request.args.get('format') == 'csv':
+        return export_to_csv(teachers, TEACHER_EXPORT_COLUMNS, 'teachers_with_passwords.csv')
     excel_file = export_teachers_to_excel(teachers)
     return send_file(excel_file, 
                     download_name='teachers_with_passwords.xlsx',
@@ -902,26 +1078,23 @@ def task_details(task_id):
     if not task:
         return redirect(url_for('analytics'))
     
-    # Get completed students
-    completed_students = Submission.get_completed_students_for_task(task_id)
-    
-    # Get all students who should complete this task
-    all_target_students = []
-    for campus in task.get('campusTarget', []):
-        for grade in task.get('gradeTarget', []):
-            students = Student.get_by_campus_grade(campus, grade)
-            all_target_students.extend(students)
-    
-    # Find pending students
-    completed_student_ids = [s['studentID'] for s in completed_students]
-    pending_students = [s for s in all_target_students if s['studentID'] not in completed_student_ids]
+    # One page each of completed and pending students
+    roster = Submission.get_task_roster(task,
+                                        after=request.args.get('after'),
+                                        completed_after=request.args.get('completed_after'),
+                                        limit=Config.STUDENT_PAGE_SIZE,
+                                        projection=Student.ROSTER_FIELDS)
     
     task['_id'] = str(task['_id'])
     
     return render_template('task_details.html', 
                          task=task, 
-                         completed_students=completed_students,
-                         pending_students=pending_students)
+                         completed_students=roster['completed'],
+                         pending_students=roster['pending'],
+                         completed_count=roster['completed_count'],
+                         pending_count=roster['pending_count'],
+                         next_completed_after=roster['next_completed_after'],
+                         next_after=roster['next_after'])
 
 @admin_required
 def view_submission(task_id, student_id):
@@ -946,14 +1119,13 @@ def view_submission(task_id, student_id):
 # Teacher Routes
 @teacher_required
 def teacher_dashboard():
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
     teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -973,54 +1145,66 @@ def teacher_dashboard():
 
 @teacher_required
 def teacher_students():
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
     
-    # Get students for teacher's campus only
-    students = Student.get_all()
-    campus_students = [s for s in students if s['campus'] == teacher['campus']]
+    try:
+        students, filters, next_cursor = student_page({'campus': teacher['campus']})
+    except ValueError:
+        return redirect(url_for('teacher_students'))
+    annotate_student_tasks(students, teacher['campus'])
     
+    return render_template('teacher_students.html', 
+                         teacher=teacher, 
+                         students=students,
+                         filters=filters,
+                         next_cursor=next_cursor,
+                         sections=STUDENT_SECTIONS)
+
+@teacher_required
+def teacher_students_page():
+    """JSON endpoint behind the teacher's student table infinite scroll"""
+    try:
+        teacher = current_user()
+        if not teacher:
+            return jsonify({'status': 'error', 'message': 'Teacher not found'})
+        students, _, next_cursor = student_page({'campus': teacher['campus']})
+        annotate_student_tasks(students, teacher['campus'])
+        return student_rows_response('teacher_student_rows.html', students, next_cursor)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+def annotate_student_tasks(students, campus):
+    """Set tasks_assigned/tasks_completed on one page of a campus's students"""
     # Get tasks that target teacher's campus
     tasks = Task.get_all()
-    campus_tasks = [t for t in tasks if teacher['campus'] in t.get('campusTarget', [])]
+    campus_tasks = [t for t in tasks if campus in t.get('campusTarget', [])]
+    
+    # Submissions for the whole page in one $group
+    completed = Submission.count_by('studentId', {'studentId': {'$in': [s['studentID'] for s in students]}})
     
     # Calculate task statistics for each student
-    for student in campus_students:
+    for student in students:
         # Get all tasks assigned to this student (based on campus and grade)
         student_tasks = [t for t in campus_tasks if student['grade'] in t.get('gradeTarget', [])]
         student['tasks_assigned'] = len(student_tasks)
-        
-        # Get submissions for this student
-        submissions = Submission.get_by_student(student['studentID'])
-        student['tasks_completed'] = len(submissions)
-    
-    # Convert ObjectId to string for template
-    for student in campus_students:
-        student['_id'] = str(student['_id'])
-    
-    return render_template('teacher_students.html', 
-                         teacher=teacher, 
-                         students=campus_students)
+        student['tasks_completed'] = completed.get(student['studentID'], 0)
 
 @teacher_required
 def teacher_add_student():
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1029,23 +1213,12 @@ def teacher_add_student():
     if not teacher.get('can_manage_students', False):
         return redirect(url_for('teacher_students'))
     
-    sections = [
-        'LL', 'HH', 'DD', 'FF', 
-        'Tata Boys', 'Tata Girls', 
-        'Google Boys', 'Google Girls', 
-        'Infosys Boys', 'Infosys Girls', 
-        'Adobe', 'Adobe Boys', 'Adobe Girls',
-        'Mahendra Boys', 'Mahendra Girls',
-        'Verizon Boys', 'Verizon Girls', 
-        'Microsoft Boys', 'Microsoft Girls'
-    ]
+    sections = STUDENT_SECTIONS
     
     if request.method == 'POST':
         # Get the count of existing students for this campus to generate ID
         campus = teacher['campus']  # Use teacher's campus
-        existing_students = Student.get_all()
-        campus_students = [s for s in existing_students if s['campus'] == campus]
-        sequence = len(campus_students) + 1
+        sequence = Student.count_by_campus(campus) + 1
         
         data = {
             'studentID': generate_student_id(campus, sequence),
@@ -1053,10 +1226,13 @@ def teacher_add_student():
             'campus': campus,  # Force to teacher's campus
             'grade': request.form.get('grade'),
             'section': request.form.get('section'),
-            'password': request.form.get('password', '123456')
+            'password': request.form.get('password', DEFAULT_PASSWORD)
         }
         
-        result = Student.create(data)
+        try:
+            result = Student.create(data)
+        except DuplicateKeyError:
+            return render_template('teacher_add_student.html', error='A student with this ID already exists', sections=sections, teacher=teacher)
         if result:
             # Get the created student to create notification
             student = Student.find_by_id(data['studentID'])
@@ -1071,14 +1247,12 @@ def teacher_add_student():
 
 @teacher_required
 def teacher_edit_student(student_id):
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1095,16 +1269,7 @@ def teacher_edit_student(student_id):
     if student['campus'] != teacher['campus']:
         return redirect(url_for('teacher_students'))
     
-    sections = [
-        'LL', 'HH', 'DD', 'FF', 
-        'Tata Boys', 'Tata Girls', 
-        'Google Boys', 'Google Girls', 
-        'Infosys Boys', 'Infosys Girls', 
-        'Adobe', 'Adobe Boys', 'Adobe Girls',
-        'Mahendra Boys', 'Mahendra Girls',
-        'Verizon Boys', 'Verizon Girls', 
-        'Microsoft Boys', 'Microsoft Girls'
-    ]
+    sections = STUDENT_SECTIONS
     
     if request.method == 'POST':
         data = {
@@ -1130,14 +1295,12 @@ def teacher_edit_student(student_id):
 
 @teacher_required
 def teacher_delete_student(student_id):
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1158,21 +1321,20 @@ def teacher_delete_student(student_id):
 
 @teacher_required
 def teacher_export_students():
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('teacher_students'))
     
     # Get students for teacher's campus only
-    students = Student.get_all()
-    campus_students = [s for s in students if s['campus'] == teacher['campus']]
+    campus_students = Student.iter_export({'campus': teacher['campus']})
+    if request.args.get('format') == 'csv':
+        return export_to_csv(campus_students, STUDENT_EXPORT_COLUMNS, f'students_{teacher["campus"]}.csv')
     
     excel_file = export_students_to_excel(campus_students)
     return send_file(excel_file, 
@@ -1181,14 +1343,12 @@ def teacher_export_students():
 
 @teacher_required
 def teacher_tasks():
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1197,27 +1357,15 @@ def teacher_tasks():
     tasks = Task.get_all()
     campus_tasks = [t for t in tasks if teacher['campus'] in t.get('campusTarget', [])]
     
+    # Campus students per grade and campus submissions per task, one $group each
+    students_by_grade = Student.count_by('grade', {'campus': teacher['campus']})
+    completions_by_task = ProgressStats.get_task_counts([t['_id'] for t in campus_tasks], teacher['campus'])
+    
     # Calculate statistics for each task
     for task in campus_tasks:
-        # Get all students who should complete this task from teacher's campus
-        all_target_students = []
-        for grade in task.get('gradeTarget', []):
-            students = Student.get_by_campus_grade(teacher['campus'], grade)
-            all_target_students.extend(students)
-        
-        task['students_assigned'] = len(all_target_students)
-        
-        # Get completed submissions for this task
-        completions = Submission.get_task_completions(str(task['_id']))
-        
-        # Filter to only include students from teacher's campus
-        completed_students = []
-        for completion in completions:
-            student = Student.find_by_id(completion['studentId'])
-            if student and student['campus'] == teacher['campus']:
-                completed_students.append(student)
-        
-        task['completions'] = len(completed_students)
+        # Students who should complete this task from teacher's campus
+        task['students_assigned'] = sum(students_by_grade.get(grade, 0) for grade in task.get('gradeTarget', []))
+        task['completions'] = completions_by_task.get(task['_id'], 0)
         
         # Calculate completion rate
         if task['students_assigned'] > 0:
@@ -1235,14 +1383,12 @@ def teacher_tasks():
 
 @teacher_required
 def teacher_add_task():
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1289,14 +1435,12 @@ def teacher_add_task():
 
 @teacher_required
 def teacher_edit_task(task_id):
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1348,14 +1492,12 @@ def teacher_edit_task(task_id):
 
 @teacher_required
 def teacher_delete_task(task_id):
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1376,14 +1518,12 @@ def teacher_delete_task(task_id):
 
 @teacher_required
 def teacher_task_details(task_id):
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1396,40 +1536,34 @@ def teacher_task_details(task_id):
     if teacher['campus'] not in task.get('campusTarget', []):
         return redirect(url_for('teacher_tasks'))
     
-    # Get completed students for this task
-    completed_students = Submission.get_completed_students_for_task(task_id)
-    
-    # Filter to only include students from teacher's campus
-    completed_students = [s for s in completed_students if s['campus'] == teacher['campus']]
-    
-    # Get all students who should complete this task from teacher's campus
-    all_target_students = []
-    for grade in task.get('gradeTarget', []):
-        students = Student.get_by_campus_grade(teacher['campus'], grade)
-        all_target_students.extend(students)
-    
-    # Find pending students
-    completed_student_ids = [s['studentID'] for s in completed_students]
-    pending_students = [s for s in all_target_students if s['studentID'] not in completed_student_ids]
+    # Completed and pending students from teacher's campus only
+    roster = Submission.get_task_roster(task,
+                                        campus=teacher['campus'],
+                                        after=request.args.get('after'),
+                                        completed_after=request.args.get('completed_after'),
+                                        limit=Config.STUDENT_PAGE_SIZE,
+                                        projection=Student.ROSTER_FIELDS)
     
     task['_id'] = str(task['_id'])
     
     return render_template('teacher_task_details.html', 
                          teacher=teacher,
                          task=task, 
-                         completed_students=completed_students,
-                         pending_students=pending_students)
+                         completed_students=roster['completed'],
+                         pending_students=roster['pending'],
+                         completed_count=roster['completed_count'],
+                         pending_count=roster['pending_count'],
+                         next_completed_after=roster['next_completed_after'],
+                         next_after=roster['next_after'])
 
 @teacher_required
 def teacher_view_submission(task_id, student_id):
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'teacher':
         return redirect(url_for('logout'))
     
-    teacher_id = payload.get('user_id')
-    teacher = Teacher.find_by_id(teacher_id)
+    teacher = current_user()
     
     if not teacher:
         return redirect(url_for('logout'))
@@ -1460,14 +1594,13 @@ def teacher_view_submission(task_id, student_id):
 # Student Routes
 @login_required
 def student_dashboard():
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     if payload.get('user_type') != 'student':
         return redirect(url_for('logout'))
     
     student_id = payload.get('user_id')
-    student = Student.find_by_id(student_id)
+    student = current_user()
     
     if not student:
         return redirect(url_for('logout'))
@@ -1475,10 +1608,10 @@ def student_dashboard():
     # Get assigned tasks
     tasks = Task.get_for_student(student['campus'], student['grade'])
     
-    # Get submission status
+    # Get submission status for every task in one query
+    submitted_at = Submission.get_submitted_at(student_id, [task['_id'] for task in tasks])
     task_status = []
     for task in tasks:
-        submission = Submission.find_by_student_task(student_id, str(task['_id']))
         task_status.append({
             'task': {
                 '_id': str(task['_id']),
@@ -1486,8 +1619,8 @@ def student_dashboard():
                 'language': task['language'],
                 'description': task.get('description', '')
             },
-            'completed': submission is not None,
-            'completed_date': submission.get('submittedAt') if submission else None
+            'completed': task['_id'] in submitted_at,
+            'completed_date': submitted_at.get(task['_id'])
         })
     
     # Get notifications for student
@@ -1512,8 +1645,7 @@ def web_editor():
         return redirect(url_for('student_dashboard'))
     
     # Get student submission if exists
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     student_id = payload.get('user_id')
     
     submission = Submission.find_by_student_task(student_id, task_id)
@@ -1526,8 +1658,7 @@ def web_editor():
 # Practice Editor Route (Available to all roles)
 @login_required
 def practice_editor():
-    token = session.get('token')
-    payload = verify_token(token)
+    payload = current_identity()
     
     # Allow all roles to access practice editor
     if payload.get('user_type') not in ['admin', 'teacher', 'student']:
@@ -1553,7 +1684,7 @@ def validate_code():
             return jsonify({"status": "error", "message": "Task not found"})
         
         # Validate code using AI
-        validation_result = validate_student_code(code, task.get('description', ''))
+        validation_result = validate_student_code(code, task.get('description', ''), task_id)
         
         # Determine if submit button should be enabled
         submit_enabled = validation_result == "Correct"
@@ -1580,6 +1711,9 @@ def generate_code():
         if not prompt:
             return jsonify({"status": "error", "message": "Prompt is required"})
         
+        if data.get("stream"):
+            return stream_ai_response(code_generation_messages(prompt, language), 'generate')
+        
         # Generate code using AI
         generated_code = generate_code_with_ai(prompt, language)
         
@@ -1603,6 +1737,9 @@ def ai_chat():
         if not messages or not isinstance(messages, list):
             return jsonify({"status": "error", "message": "Valid messages array is required"})
         
+        if data.get("stream"):
+            return stream_ai_response(messages, 'chat')
+        
         # Chat with AI
         response = chat_with_ai(messages)
         
@@ -1615,6 +1752,11 @@ def ai_chat():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
+# AI client metrics (per web worker process)
+@admin_required
+def ai_metrics():
+    return jsonify({"status": "success", "metrics": ai_client.metrics()})
+
 # Compile Routes
 @login_required
 def install_arduino_libraries():
@@ -1631,6 +1773,9 @@ def install_arduino_libraries():
                 else:
                     outputs.append(f"✗ Error installing {lib}: {result.stderr.strip()}")
 
+        # Installed libraries are part of the compile cache key
+        invalidate_toolchain_fingerprint()
+
         output_text = "\n".join(outputs)
         status = "success" if not outputs or all("Successfully" in out for out in outputs) else "error"
 
@@ -1667,68 +1812,78 @@ def compile_code():
     try:
         data = request.get_json()
         code = data.get("code", "")
-        task_id = data.get("task_id", "")
 
         if not code:
             return jsonify({"status": "error", "output": "No code provided"}), 400
 
-        # Create temp directory
-        temp_dir = tempfile.mkdtemp()
-        sketch_name = os.path.basename(temp_dir)
-        sketch_path = os.path.join(temp_dir, f"{sketch_name}.ino")
-
-        with open(sketch_path, "w") as f:
-            f.write(code)
+        sketch, fqbn, key = prepare_sketch(code)
+        # Without a cached toolchain fingerprint there is no key yet; the job works it out
+        cached = cached_result(key) if key else None
+        if cached:
+            return jsonify(dict(cached, job_id=key))
 
-        cmd = ["arduino-cli", "compile", "--fqbn", "arduino:avr:uno", temp_dir]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        try:
+            job = compile_runner.submit(compile_prepared, sketch, fqbn, key, job_id=key)
+        except QueueFull as e:
+            return queue_full_response(e, "compiler")
 
-        if result.returncode == 0:
-            return jsonify({"status": "success", "output": result.stdout})
-        else:
-            return jsonify({"status": "error", "output": result.stderr})
+        # Never wait in the request thread; the client polls /compile/<job_id>
+        return jsonify(compile_runner.describe(job)), 202
 
     except Exception as e:
         return jsonify({"status": "error", "output": f"Compilation failed: {str(e)}"})
-    finally:
-        if 'temp_dir' in locals() and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+
+@login_required
+def compile_status(job_id):
+    job = compile_runner.get(job_id)
+    if job:
+        return jsonify(compile_runner.describe(job))
+
+    # Finished builds outlive the job registry in the shared compile cache
+    cached = cached_result(job_id)
+    if cached:
+        return jsonify(dict(cached, job_id=job_id))
+    return jsonify({"status": "error", "output": "Compile job not found"}), 404
+
+def job_owner():
+    payload = current_identity()
+    return (payload.get('user_type'), payload.get('user_id'))
+
+def queue_full_response(error, what):
+    response = jsonify({
+        "status": "busy",
+        "queue_position": error.queue_position,
+        "output": f"The {what} is busy ({error.queue_position - 1} runs waiting). Please try again in a moment."
+    })
+    response.headers['Retry-After'] = '2'
+    return response, 429
 
 @login_required
 def run_python():
     try:
         data = request.get_json()
         code = data.get("code", "")
-        task_id = data.get("task_id", "")
 
         if not code:
             return jsonify({"status": "error", "output": "No code provided"}), 400
 
-        temp_dir = tempfile.mkdtemp()
-        file_path = os.path.join(temp_dir, "script.py")
+        try:
+            job = python_runner.submit(run_python_code, code, owner=job_owner())
+        except QueueFull as e:
+            return queue_full_response(e, "code runner")
 
-        with open(file_path, "w") as f:
-            f.write(code)
+        # Never wait in the request thread; the client polls /python_run/<job_id>
+        return jsonify(python_runner.describe(job)), 202
 
-        result = subprocess.run(
-            [sys.executable, file_path],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-
-        if result.returncode == 0:
-            return jsonify({"status": "success", "output": result.stdout})
-        else:
-            return jsonify({"status": "error", "output": result.stderr})
-
-    except subprocess.TimeoutExpired:
-        return jsonify({"status": "error", "output": "Execution timed out!"})
     except Exception as e:
         return jsonify({"status": "error", "output": f"Execution failed: {str(e)}"})
-    finally:
-        if 'temp_dir' in locals() and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+
+@login_required
+def python_run_status(job_id):
+    job = python_runner.get(job_id, owner=job_owner())
+    if not job:
+        return jsonify({"status": "error", "output": "Run not found"}), 404
+    return jsonify(python_runner.describe(job))
 
 @login_required
 def submit_task():
@@ -1741,8 +1896,7 @@ def submit_task():
         if not task_id or not code:
             return jsonify({"status": "error", "message": "Task ID and code are required"})
         
-        token = session.get('token')
-        payload = verify_token(token)
+        payload = current_identity()
         user_type = payload.get('user_type')
         
         if user_type == 'student':
@@ -1760,8 +1914,8 @@ def submit_task():
         result = Submission.create(submission_data)
         if result:
             # Get the created submission, student, and task to create notification
-            submission = Submission.find_by_student_task(user_id, task_id)
-            student = Student.find_by_id(user_id)
+            submission = Submission.find_by_student_task(user_id, task_id, projection={'_id': 1})
+            student = current_user()
             task = Task.find_by_id(task_id)
             
             if submission and student and task:
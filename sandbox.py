@@ -0,0 +1,220 @@
+import json
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from config import Config
+from workers import JobPool
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_worker.py')
+
+# Applies rlimits in a fresh interpreter, then execs the student script so the
+# limits carry over without running preexec_fn in a threaded web worker.
+LIMITS_BOOTSTRAP = """
+import os, resource, sys
+cpu, memory, output = (int(value) for value in sys.argv[1:4])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_FSIZE, (output, output))
+os.execv(sys.executable, [sys.executable] + sys.argv[4:])
+"""
+
+def read_output(path):
+    with open(path, 'rb') as f:
+        return f.read(Config.PYTHON_RUN_OUTPUT_LIMIT).decode('utf-8', errors='replace')
+
+def run_python_subprocess(code):
+    """Run student code in a fresh resource-limited interpreter; returns {'status', 'output'}"""
+    temp_dir = tempfile.mkdtemp(prefix='pyrun-')
+    try:
+        file_path = os.path.join(temp_dir, "script.py")
+        stdout_path = os.path.join(temp_dir, "stdout.txt")
+        stderr_path = os.path.join(temp_dir, "stderr.txt")
+
+        with open(file_path, "w") as f:
+            f.write(code)
+
+        cmd = [
+            sys.executable, '-c', LIMITS_BOOTSTRAP,
+            str(Config.PYTHON_RUN_CPU_SECONDS),
+            str(Config.PYTHON_RUN_MEMORY_MB * 1024 * 1024),
+            str(Config.PYTHON_RUN_OUTPUT_LIMIT),
+            file_path
+        ]
+        env = dict(os.environ, PYTHONIOENCODING='utf-8', OPENBLAS_NUM_THREADS='1')
+        with open(stdout_path, 'wb') as stdout, open(stderr_path, 'wb') as stderr:
+            result = subprocess.run(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=stderr,
+                cwd=temp_dir,
+                env=env,
+                timeout=Config.PYTHON_RUN_TIMEOUT
+            )
+
+        # RLIMIT_FSIZE stops writes at the cap (CPython ignores SIGXFSZ)
+        if os.path.getsize(stdout_path) >= Config.PYTHON_RUN_OUTPUT_LIMIT:
+            return {"status": "error", "output": read_output(stdout_path) + "\nOutput limit exceeded!"}
+        if result.returncode == 0:
+            return {"status": "success", "output": read_output(stdout_path)}
+        if result.returncode == -signal.SIGXCPU:
+            return {"status": "error", "output": "CPU time limit exceeded!"}
+        return {"status": "error", "output": read_output(stderr_path)}
+
+    except subprocess.TimeoutExpired:
+        return {"status": "error", "output": "Execution timed out!"}
+    except Exception as e:
+        return {"status": "error", "output": f"Execution failed: {str(e)}"}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+class WarmWorker:
+    """One pre-started sandbox_worker.py process and its private working directory"""
+    def __init__(self):
+        self.runs = 0
+        self.buffer = b''
+        self.cwd = tempfile.mkdtemp(prefix='pywarm-')
+        cmd = [
+            sys.executable, WORKER_SCRIPT,
+            str(Config.PYTHON_RUN_CPU_SECONDS),
+            str(Config.PYTHON_RUN_MEMORY_MB * 1024 * 1024),
+            str(Config.PYTHON_RUN_OUTPUT_LIMIT),
+            str(Config.PYTHON_RUN_TIMEOUT)
+        ]
+        env = dict(os.environ, PYTHONIOENCODING='utf-8', OPENBLAS_NUM_THREADS='1')
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.cwd,
+            env=env
+        )
+        if self.read_message(Config.PYTHON_RUN_TIMEOUT) is None:
+            self.close()
+            raise RuntimeError('Sandbox worker failed to start')
+
+    def read_message(self, timeout):
+        """Read one JSON line from the worker, or None on timeout/EOF"""
+        deadline = time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                return None
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return None
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line)
+
+    def run(self, code):
+        self.runs += 1
+        self.process.stdin.write((json.dumps({'code': code}) + '\n').encode('utf-8'))
+        self.process.stdin.flush()
+        # The worker enforces PYTHON_RUN_TIMEOUT on its child; this only
+        # catches a worker that stopped answering altogether
+        return self.read_message(Config.PYTHON_RUN_TIMEOUT + 5)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        shutil.rmtree(self.cwd, ignore_errors=True)
+
+class WarmInterpreterPool:
+    """Pool of pre-started, pre-warmed interpreters that run student code over a pipe.
+
+    Each run executes in a child forked from the warm interpreter, so state a
+    run changes (patched modules, imports, files, threads, child processes)
+    dies with the child and never reaches the next student. Workers are still
+    recycled after PYTHON_RUN_WARM_MAX_RUNS runs or if they stop answering;
+    replacements are started in the background.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def prewarm(self):
+        threading.Thread(target=self.replenish, daemon=True).start()
+
+    def replenish(self):
+        while True:
+            with self.lock:
+                if len(self.idle) >= self.size:
+                    return
+            try:
+                worker = WarmWorker()
+            except Exception as e:
+                print(f"❌ Could not start sandbox worker: {e}")
+                return
+            with self.lock:
+                self.idle.append(worker)
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return WarmWorker()
+
+    def release(self, worker, reusable):
+        if reusable and worker.runs < Config.PYTHON_RUN_WARM_MAX_RUNS:
+            with self.lock:
+                if len(self.idle) < self.size:
+                    self.idle.append(worker)
+                    return
+        worker.close()
+        self.prewarm()
+
+    def run(self, code):
+        try:
+            worker = self.acquire()
+        except Exception as e:
+            return {"status": "error", "output": f"Execution failed: {str(e)}"}
+
+        try:
+            result = worker.run(code)
+        except OSError:
+            result = None
+
+        if result is None:
+            timed_out = worker.process.poll() is None
+            self.release(worker, reusable=False)
+            if timed_out:
+                return {"status": "error", "output": "Execution timed out!"}
+            return {"status": "error", "output": "Execution failed: the interpreter exited unexpectedly"}
+
+        self.release(worker, reusable=True)
+        if result['status'] == 'success':
+            return {"status": "success", "output": result['stdout']}
+        if result['note']:
+            output = result['stdout'] + result['stderr']
+            if output and not output.endswith('\n'):
+                output += '\n'
+            return {"status": "error", "output": output + result['note']}
+        return {"status": "error", "output": result['stderr']}
+
+warm_pool = WarmInterpreterPool(Config.PYTHON_RUN_WORKERS)
+if Config.PYTHON_RUN_WARM_POOL:
+    warm_pool.prewarm()
+
+def run_python_code(code):
+    """Run student code on a warm interpreter, or a fresh one if the pool is disabled"""
+    if Config.PYTHON_RUN_WARM_POOL:
+        return warm_pool.run(code)
+    return run_python_subprocess(code)
+
+# Shared pool for /python_run; each gunicorn worker process gets its own and
+# routes.py records its jobs in Mongo so any process can answer a poll
+python_runner = JobPool('python-run', Config.PYTHON_RUN_WORKERS, Config.PYTHON_RUN_QUEUE_LIMIT)
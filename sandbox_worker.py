@@ -0,0 +1,178 @@
+"""Pre-warmed interpreter for /python_run.
+
+Started by sandbox.WarmInterpreterPool. Reads one JSON request per line
+({"code": ...}) and answers with one JSON line per run. Each run happens in
+a child forked from this process, so student code only ever changes its own
+copy of the interpreter. Usage:
+
+    python sandbox_worker.py <cpu_seconds> <memory_bytes> <output_limit> <wall_seconds>
+"""
+import builtins
+import io
+import json
+import os
+import random
+import resource
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+# Common modules students use, imported once per worker instead of once per run
+PRELOADED = ('collections', 'datetime', 'functools', 'itertools', 'math', 're', 'string')
+for module in PRELOADED:
+    __import__(module)
+
+class CpuLimitExceeded(BaseException):
+    pass
+
+class OutputLimitExceeded(BaseException):
+    pass
+
+class BoundedWriter(io.StringIO):
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+        if self.size > self.limit:
+            super().write(text[:max(0, self.limit - (self.size - len(text)))])
+            raise OutputLimitExceeded()
+        return super().write(text)
+
+def on_cpu_limit(signum, frame):
+    raise CpuLimitExceeded()
+
+def run(code, cpu_seconds, output_limit):
+    stdout = BoundedWriter(output_limit)
+    stderr = BoundedWriter(output_limit)
+    namespace = {'__name__': '__main__', '__builtins__': builtins}
+    status = 'success'
+    note = ''
+
+    sys.stdout, sys.stderr, sys.stdin = stdout, stderr, io.StringIO('')
+    signal.setitimer(signal.ITIMER_PROF, cpu_seconds)
+    try:
+        try:
+            exec(compile(code, 'script.py', 'exec'), namespace)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                status = 'error'
+                if not isinstance(e.code, int):
+                    stderr.write(f'{e.code}\n')
+        except SyntaxError as e:
+            status = 'error'
+            traceback.print_exception(type(e), e, None, file=stderr)
+        except (CpuLimitExceeded, OutputLimitExceeded):
+            raise
+        except BaseException as e:
+            status = 'error'
+            # Drop this module's frame so the traceback starts at script.py
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next, file=stderr)
+    except CpuLimitExceeded:
+        status, note = 'error', 'CPU time limit exceeded!'
+    except OutputLimitExceeded:
+        status, note = 'error', 'Output limit exceeded!'
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        sys.stdout, sys.stderr, sys.stdin = sys.__stdout__, sys.__stderr__, sys.__stdin__
+
+    return {'status': status, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'note': note}
+
+# Bound before any student code runs, which may replace json.dumps in its child
+encode_result = json.dumps
+
+def failed(note):
+    return {'status': 'error', 'stdout': '', 'stderr': '', 'note': note}
+
+def run_in_child(code, cpu_seconds, output_limit, wall_seconds, private_fds=()):
+    """Fork, run code in the child and return its result.
+
+    The child gets a fresh working directory and its own process group;
+    afterwards the whole group is killed, so processes the code started die
+    with it, and the directory is removed. private_fds (the protocol pipes)
+    are closed in the child so student code cannot write fake responses.
+    """
+    run_dir = tempfile.mkdtemp(prefix='run-', dir=os.getcwd())
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            for fd in (read_fd, *private_fds):
+                os.close(fd)
+            os.setpgid(0, 0)
+            os.chdir(run_dir)
+            # A forked child's CPU time starts at zero, so this caps just this run
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds + 1, cpu_seconds + 2))
+            # Files the code writes are capped like its output; an oversized
+            # write raises OSError (EFBIG) instead of killing the run
+            resource.setrlimit(resource.RLIMIT_FSIZE, (output_limit, output_limit))
+            signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+            random.seed()
+            result = encode_result(run(code, cpu_seconds, output_limit))
+            with os.fdopen(write_fd, 'wb') as out:
+                out.write(result.encode('utf-8'))
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    chunks = []
+    deadline = time.monotonic() + wall_seconds
+    timed_out = False
+    while True:
+        remaining = deadline - time.monotonic()
+        ready = select.select([read_fd], [], [], remaining)[0] if remaining > 0 else []
+        if not ready:
+            timed_out = True
+            break
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read_fd)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    os.waitpid(pid, 0)
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+    if timed_out:
+        return failed('Execution timed out!')
+    try:
+        return json.loads(b''.join(chunks))
+    except ValueError:
+        # e.g. the code called os._exit() or was killed by RLIMIT_CPU
+        return failed('Execution failed: the interpreter exited unexpectedly')
+
+def main():
+    cpu_seconds, memory, output_limit, wall_seconds = (int(value) for value in sys.argv[1:5])
+
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    signal.signal(signal.SIGPROF, on_cpu_limit)
+
+    # Keep the protocol on private fds so stray os.write(1, ...) calls from
+    # student code cannot corrupt it
+    requests = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    responses = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+    responses.write(json.dumps({'ready': True}) + '\n')
+    responses.flush()
+
+    for line in requests:
+        request = json.loads(line)
+        result = run_in_child(request['code'], cpu_seconds, output_limit, wall_seconds,
+                              private_fds=(requests.fileno(), responses.fileno()))
+        responses.write(json.dumps(result) + '\n')
+        responses.flush()
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
 from database import db
-from models import Admin, Campus, Grade
-import bcrypt
+from models import ProgressStats, NotificationReadState, hash_password
+from indexes import ensure_indexes
 import datetime
 
 def setup_database():
     # Create default admin user
     admin_collection = db.get_collection('admins')
     if admin_collection.count_documents({}) == 0:
-        password_hash = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
+        password_hash = hash_password('admin123')
         admin_collection.insert_one({
             'username': 'admin',
             'passwordHash': password_hash,
@@ -41,6 +41,17 @@ def setup_database():
         grades_collection.insert_many(default_grades)
         print("✅ Default grades created (1st to 10th Class)")
     
+    # Create indexes for every model collection
+    ensure_indexes()
+    
+    # Build the progress counters on first setup or after upgrading
+    if ProgressStats.ensure_built():
+        print("✅ Progress counters built")
+    
+    # Carry the legacy shared isRead flags over to per-user read state once
+    if NotificationReadState.ensure_migrated():
+        print("✅ Notification read state migrated")
+    
     print("🎉 Database setup completed!")
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+// Stream an AI reply from /ai_chat or /generate_code, calling onToken with the
+// text received so far. Resolves with the full text, or rejects on error.
+async function streamAI(endpoint, payload, onToken) {
+    const response = await fetch(endpoint, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(Object.assign({ stream: true }, payload))
+    });
+
+    // Errors such as a missing prompt still come back as plain JSON
+    if (!(response.headers.get("Content-Type") || "").startsWith("text/event-stream")) {
+        const data = await response.json();
+        if (data.status !== "success") {
+            throw new Error(data.message || "AI request failed");
+        }
+        const text = data.response || data.code || "";
+        onToken(text);
+        return text;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let text = "";
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            throw new Error("AI stream ended unexpectedly");
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const event = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            if (!event.startsWith("data:")) {
+                continue;
+            }
+            const data = JSON.parse(event.slice(5));
+            if (data.status === "streaming") {
+                text += data.token;
+                onToken(text);
+            } else if (data.status === "success") {
+                return text;
+            } else {
+                throw new Error(data.message || "AI request failed");
+            }
+        }
+    }
+}
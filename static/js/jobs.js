@@ -0,0 +1,27 @@
+// Submit work to a job endpoint (/python_run, /compile) and poll until it finishes.
+// Cached compiles come back already finished, so the loop may not run at all.
+async function runJob(endpoint, payload, onProgress) {
+    const response = await fetch(endpoint, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(payload)
+    });
+    let data = await response.json();
+
+    while (data.status === "queued" || data.status === "running") {
+        if (onProgress) {
+            onProgress(data);
+        }
+        await new Promise(resolve => setTimeout(resolve, 400));
+        const poll = await fetch(`${endpoint}/${data.job_id}`);
+        data = await poll.json();
+    }
+    return data;
+}
+
+function describeJobProgress(data) {
+    if (data.status === "queued" && data.queue_position) {
+        return `Queued (position ${data.queue_position})...`;
+    }
+    return "Running...";
+}
@@ -0,0 +1,45 @@
+// Infinite scroll for keyset-paginated tables. The button carries the JSON
+// endpoint and the next cursor; each page's rendered rows are appended to
+// tbody, keeping the page's current filters from the query string.
+function infiniteRows(tbody, button) {
+    if (!tbody || !button) {
+        return;
+    }
+    let loading = false;
+
+    async function loadMore() {
+        const cursor = button.dataset.cursor;
+        if (loading || !cursor) {
+            return;
+        }
+        loading = true;
+        button.disabled = true;
+        try {
+            const params = new URLSearchParams(window.location.search);
+            params.set("cursor", cursor);
+            const response = await fetch(`${button.dataset.endpoint}?${params}`);
+            const data = await response.json();
+            if (data.status !== "success") {
+                throw new Error(data.message || "Could not load more rows");
+            }
+            tbody.insertAdjacentHTML("beforeend", data.html);
+            button.dataset.cursor = data.next_cursor || "";
+            button.hidden = !data.next_cursor;
+        } catch (error) {
+            console.error("Error loading rows:", error);
+        } finally {
+            loading = false;
+            button.disabled = false;
+        }
+    }
+
+    button.addEventListener("click", loadMore);
+    if ("IntersectionObserver" in window) {
+        // Load the next page as the button scrolls into view
+        new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMore();
+            }
+        }, { rootMargin: "200px" }).observe(button);
+    }
+}
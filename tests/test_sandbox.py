@@ -0,0 +1,70 @@
+"""Isolation between runs on a warm /python_run interpreter.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from sandbox import WarmInterpreterPool
+
+@pytest.fixture
+def pool():
+    pool = WarmInterpreterPool(1)
+    pool.replenish()
+    yield pool
+    for worker in pool.idle:
+        worker.close()
+
+def test_patched_json_dumps_does_not_reach_next_run(pool):
+    first = pool.run('import json\njson.dumps = lambda *a, **k: \'{"status": "success", "stdout": "stolen"}\'\nprint("first")')
+    second = pool.run('print("second")')
+    assert second == {'status': 'success', 'output': 'second\n'}
+    assert first['output'] != 'stolen'
+
+def test_patched_modules_do_not_reach_next_run(pool):
+    pool.run('import os, sys, io\nos.getcwd = None\nsys.modules["math"] = None\nio.StringIO = None\n'
+             'import __main__\n__main__.run = None\nopen("left-behind.txt", "w").write("x")')
+    result = pool.run('import os, math, io\nprint(math.sqrt(16), os.path.exists("left-behind.txt"), io.StringIO is not None)')
+    assert result == {'status': 'success', 'output': '4.0 False True\n'}
+
+def test_spawned_processes_are_killed(pool):
+    started = pool.run('import subprocess\nprint(subprocess.Popen(["sleep", "30"]).pid)')
+    pid = int(started['output'])
+    # SIGKILL lands asynchronously, and killed processes may linger as
+    # zombies until init reaps them
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                state = f.read().rsplit(')', 1)[1].split()[0]
+        except FileNotFoundError:
+            state = 'gone'
+        if state in ('gone', 'Z'):
+            break
+        time.sleep(0.05)
+    assert state in ('gone', 'Z')
+
+def test_large_file_writes_fail(pool):
+    result = pool.run(
+        'import os\n'
+        'try:\n'
+        f'    open("big.bin", "wb").write(b"x" * {Config.PYTHON_RUN_OUTPUT_LIMIT * 4})\n'
+        'except OSError as e:\n'
+        '    print(e.strerror, os.path.getsize("big.bin"))')
+    assert result['status'] == 'success'
+    reason, size = result['output'].rsplit(' ', 1)
+    assert reason == 'File too large'
+    assert int(size) <= Config.PYTHON_RUN_OUTPUT_LIMIT
+
+def test_worker_is_reused_across_runs(pool):
+    pool.run('print(1)')
+    worker = pool.idle[0]
+    pool.run('import os\nos._exit(3)')
+    assert pool.run('print(2)') == {'status': 'success', 'output': '2\n'}
+    assert pool.idle[0] is worker
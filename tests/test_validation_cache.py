@@ -0,0 +1,73 @@
+"""AI validation verdicts are cached: a repeat validation never reaches OpenRouter.
+
+OpenRouter is replaced by a local stub of the chat-completions endpoint and
+MongoDB by mongomock, so this runs offline:
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# database.py connects to Atlas on import; point the models at mongomock instead
+if 'database' not in sys.modules:
+    database = types.ModuleType('database')
+    database.db = mongomock.MongoClient().get_database('taskdb')
+    sys.modules['database'] = database
+
+from config import Config
+from models import ValidationCache
+from routes import validate_student_code
+
+class StubOpenRouter(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        StubOpenRouter.requests.append(body)
+        reply = json.dumps({'choices': [{'message': {'content': 'Correct'}}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def openrouter(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenRouter)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(Config, 'OPENROUTER_API_URL', f'http://127.0.0.1:{server.server_port}/api/v1/chat/completions')
+    StubOpenRouter.requests = []
+    yield StubOpenRouter.requests
+    server.shutdown()
+    server.server_close()
+
+def test_repeat_validation_is_served_from_cache(openrouter):
+    code = 'print("hello")\n'
+    description = 'Print hello'
+    key = ValidationCache.make_key(code, description, Config.OPENROUTER_MODEL)
+
+    assert validate_student_code(code, description, task_id='task-1') == 'Correct'
+    assert len(openrouter) == 1
+    assert ValidationCache.collection.find_one({'_id': key})['hits'] == 0
+
+    # Trailing whitespace does not change the key; answered by the in-process LRU
+    assert validate_student_code(code + '   \n', description, task_id='task-1') == 'Correct'
+    # Answered by Mongo, as another worker process would be
+    ValidationCache.local.clear()
+    assert validate_student_code(code, description, task_id='task-1') == 'Correct'
+
+    assert len(openrouter) == 1
+    assert ValidationCache.collection.find_one({'_id': key})['hits'] == 2
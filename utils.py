@@ -23,7 +23,7 @@ def verify_token(token):
         return None
 
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(Config.BCRYPT_ROUNDS))
 
 def check_password(password, hashed):
     return bcrypt.checkpw(password.encode('utf-8'), hashed)
@@ -0,0 +1,147 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+class QueueFull(Exception):
+    """Raised when a JobPool cannot admit another job"""
+    def __init__(self, queue_position):
+        super().__init__(f'Queue is full ({queue_position - 1} jobs waiting)')
+        self.queue_position = queue_position
+
+class Job:
+    def __init__(self, job_id, owner=None):
+        self.id = job_id
+        self.owner = owner
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.queue_position = 0
+        self.done = threading.Event()
+
+class JobPool:
+    """Bounded worker pool with admission control and a registry of recent jobs.
+
+    At most max_workers jobs run at once and at most max_queue wait behind
+    them; submit() raises QueueFull instead of queueing without limit.
+    Finished jobs stay pollable for keep_finished seconds.
+
+    After persist_to(collection) every job's status is also written to
+    Mongo, so get() can answer a poll for a job accepted by another
+    process. A record whose process died mid-job expires after
+    keep_unfinished seconds.
+    """
+    def __init__(self, name, max_workers, max_queue, keep_finished=300, keep_unfinished=3600):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.keep_finished = keep_finished
+        self.keep_unfinished = keep_unfinished
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.queued = []
+        self.jobs = {}
+        self.store = None
+
+    def persist_to(self, collection):
+        """Record job status in collection (see models.JobRecord)"""
+        self.store = collection
+
+    def submit(self, fn, *args, owner=None, job_id=None):
+        """Queue fn(*args). Passing a job_id deduplicates: while a job with that
+        ID is queued or running, the existing job is returned instead."""
+        with self.lock:
+            self.prune()
+            existing = self.jobs.get(job_id) if job_id else None
+            if existing and existing.status != 'done' and existing.owner == owner:
+                return existing
+            if len(self.queued) >= self.max_queue:
+                raise QueueFull(len(self.queued) + 1)
+            job = Job(job_id or uuid.uuid4().hex, owner)
+            self.queued.append(job)
+            self.jobs[job.id] = job
+            position = len(self.queued)
+        self.save(job, queuePosition=position, owner=list(owner) if owner else None)
+        self.executor.submit(self.run, job, fn, args)
+        return job
+
+    def run(self, job, fn, args):
+        with self.lock:
+            self.queued.remove(job)
+            job.status = 'running'
+        self.save(job, queuePosition=0)
+        try:
+            job.result = fn(*args)
+        except Exception as e:
+            job.error = e
+        finally:
+            with self.lock:
+                job.status = 'done'
+                job.finished_at = time.time()
+            job.done.set()
+            self.save(job, result=job.result, error=str(job.error) if job.error is not None else None)
+
+    def save(self, job, **fields):
+        """Write the job's status to the store, if there is one"""
+        if self.store is None:
+            return
+        keep = self.keep_finished if job.status == 'done' else self.keep_unfinished
+        fields.update(pool=self.name, status=job.status,
+                      expiresAt=datetime.utcnow() + timedelta(seconds=keep))
+        try:
+            self.store.update_one({'_id': job.id}, {'$set': fields}, upsert=True)
+        except Exception as e:
+            # The local process still answers polls for its own jobs
+            print(f"❌ Error saving {self.name} job {job.id}: {e}")
+
+    def load(self, job_id):
+        """Rebuild a job recorded by another process, or None"""
+        if self.store is None:
+            return None
+        record = self.store.find_one({'_id': job_id, 'pool': self.name,
+                                      'expiresAt': {'$gt': datetime.utcnow()}})
+        if not record:
+            return None
+        job = Job(job_id, tuple(record['owner']) if record.get('owner') else None)
+        job.status = record['status']
+        job.queue_position = record.get('queuePosition', 0)
+        job.result = record.get('result')
+        if record.get('error') is not None:
+            job.error = Exception(record['error'])
+        return job
+
+    def get(self, job_id, owner=None):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        job = job or self.load(job_id)
+        if job and job.owner != owner:
+            return None
+        return job
+
+    def position(self, job):
+        """1-based position in the queue, or 0 once the job has started"""
+        with self.lock:
+            try:
+                return self.queued.index(job) + 1
+            except ValueError:
+                # Started, or queued in another process as of its last save
+                return job.queue_position if job.status == 'queued' else 0
+
+    def describe(self, job):
+        """JSON-ready status for a job: its result once done, else queue progress"""
+        if job.status == 'done':
+            if job.error is not None:
+                return {'status': 'error', 'output': str(job.error), 'job_id': job.id}
+            return dict(job.result, job_id=job.id)
+        return {'status': job.status, 'job_id': job.id, 'queue_position': self.position(job)}
+
+    def prune(self):
+        # Caller must hold self.lock
+        cutoff = time.time() - self.keep_finished
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]